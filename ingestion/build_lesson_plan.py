@@ -8,27 +8,34 @@ Usage:
 from __future__ import annotations
 
 import argparse
-import json
+import os
 import re
 import sys
-import uuid
 from typing import Any
 
 from google import genai
 
+import jsonfast
+import plan_cache
 from config import GEMINI_API_KEY, GEMINI_GENERATION_MODEL
 from snowflake_rag import (
     ensure_rag_schema,
     get_chunks_for_course,
     get_lesson_plan,
     get_syllabus_text,
-    insert_subtopic,
-    insert_topic,
-    insert_unit,
+    insert_subtopics_bulk,
+    insert_topics_bulk,
+    insert_units_bulk,
 )
 
 _client: genai.Client | None = None
 
+# Gemini often wraps JSON in a markdown fence despite instructions; compiled once
+_FENCE_RE = re.compile(r"```(?:json)?\s*([\s\S]*?)```")
+
+# Bump when the extraction prompts change so stale cached plans aren't reused
+_PROMPT_VERSION = "1"
+
 
 def _get_client() -> genai.Client:
     global _client
@@ -39,13 +46,43 @@ def _get_client() -> genai.Client:
     return _client
 
 
-def _short_id() -> str:
-    return uuid.uuid4().hex[:12]
+def _short_ids(n: int) -> list[str]:
+    """n random 12-hex-char IDs from one urandom read (6 bytes = 2^48 per ID)."""
+    b = os.urandom(6 * n)
+    return [b[i * 6 : (i + 1) * 6].hex() for i in range(n)]
+
+
+def _extract_plan(prompt: str) -> dict[str, Any] | None:
+    """
+    Send one plan-extraction prompt to Gemini and parse the JSON reply.
+    Successful parses are cached on disk keyed by (model, prompt version,
+    prompt hash), so rerunning over an unchanged syllabus skips the API call.
+    """
+    key = plan_cache.cache_key(GEMINI_GENERATION_MODEL, _PROMPT_VERSION, prompt)
+    cached = plan_cache.get(key)
+    if cached is not None:
+        return cached
+    client = _get_client()
+    try:
+        response = client.models.generate_content(
+            model=GEMINI_GENERATION_MODEL,
+            contents=prompt,
+        )
+        text = response.text if hasattr(response, "text") else str(response)
+        text = text.strip()
+        m = _FENCE_RE.search(text)
+        if m:
+            text = m.group(1).strip()
+        plan = jsonfast.loads(text)
+    except Exception:
+        return None
+    if isinstance(plan, dict):
+        plan_cache.put(key, plan)
+    return plan
 
 
 def _extract_plan_from_syllabus(syllabus_text: str, course_name: str) -> dict[str, Any] | None:
     """Use Gemini to extract unit/topic/subtopic structure from syllabus text."""
-    client = _get_client()
     prompt = f"""You are analyzing a course syllabus to extract a conceptual lesson plan.
 
 Course: {course_name}
@@ -58,24 +95,11 @@ Example for "Data Structures": Unit "Trees" -> Topic "Binary Search Trees" -> Su
 Return ONLY valid JSON in this exact format (no markdown, no explanation):
 {{"units": [{{"unit_name": "Name", "topics": [{{"topic_name": "Name", "subtopics": ["Name1", "Name2"]}}]}}]}}
 Use empty arrays where there are no topics or subtopics. Be concise with names."""
-    try:
-        response = client.models.generate_content(
-            model=GEMINI_GENERATION_MODEL,
-            contents=prompt,
-        )
-        text = response.text if hasattr(response, "text") else str(response)
-        text = text.strip()
-        m = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
-        if m:
-            text = m.group(1).strip()
-        return json.loads(text)
-    except (json.JSONDecodeError, Exception):
-        return None
+    return _extract_plan(prompt)
 
 
 def _extract_plan_from_content(sample_texts: list[str], course_name: str) -> dict[str, Any] | None:
     """Use Gemini to propose a lesson plan from sampled course content."""
-    client = _get_client()
     combined = "\n\n---\n\n".join((t[:800] for t in sample_texts[:15]))  # cap total context
     prompt = f"""You are creating a conceptual lesson plan for a course based on sample content.
 
@@ -88,19 +112,7 @@ Propose a hierarchy: Units (major conceptual areas), each with optional Topics,
 Return ONLY valid JSON in this format (no markdown):
 {{"units": [{{"unit_name": "Name", "topics": [{{"topic_name": "Name", "subtopics": ["Name1", "Name2"]}}]}}]}}
 Use empty arrays where needed. Be concise."""
-    try:
-        response = client.models.generate_content(
-            model=GEMINI_GENERATION_MODEL,
-            contents=prompt,
-        )
-        text = response.text if hasattr(response, "text") else str(response)
-        text = text.strip()
-        m = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
-        if m:
-            text = m.group(1).strip()
-        return json.loads(text)
-    except (json.JSONDecodeError, Exception):
-        return None
+    return _extract_plan(prompt)
 
 
 def build_lesson_plan_for_course(course_id: str, course_name: str = "") -> dict[str, Any]:
@@ -123,25 +135,41 @@ def build_lesson_plan_for_course(course_id: str, course_name: str = "") -> dict[
     if not plan_data or not plan_data.get("units"):
         return {"units": [], "source": "none", "message": "Could not extract or generate a lesson plan."}
 
+    # One urandom read covers every row ID (upper bound; blank names just leave spares)
+    units = plan_data["units"]
+    id_budget = len(units) + sum(
+        len(u.get("topics") or []) + sum(len(t.get("subtopics") or []) for t in u.get("topics") or [])
+        for u in units
+    )
+    next_id = iter(_short_ids(id_budget)).__next__
+
+    # Collect all rows first, then write each table in a single multi-row statement
+    # (one Snowflake round-trip per table instead of one per row).
+    units_rows: list[tuple[str, str, str, int]] = []
+    topics_rows: list[tuple[str, str, str, int]] = []
+    subtopics_rows: list[tuple[str, str, str, int]] = []
     sort_order = 0
-    for u in plan_data["units"]:
+    for u in units:
         unit_name = (u.get("unit_name") or "").strip()
         if not unit_name:
             continue
-        unit_id = _short_id()
-        insert_unit(unit_id, course_id, unit_name, sort_order)
+        unit_id = next_id()
+        units_rows.append((unit_id, course_id, unit_name, sort_order))
         sort_order += 1
         for t in u.get("topics") or []:
             topic_name = (t.get("topic_name") or "").strip()
             if not topic_name:
                 continue
-            topic_id = _short_id()
-            insert_topic(topic_id, unit_id, topic_name, 0)
+            topic_id = next_id()
+            topics_rows.append((topic_id, unit_id, topic_name, 0))
             for i, sub_name in enumerate(t.get("subtopics") or []):
                 sub_name = (sub_name if isinstance(sub_name, str) else str(sub_name)).strip()
                 if not sub_name:
                     continue
-                insert_subtopic(_short_id(), topic_id, sub_name, i)
+                subtopics_rows.append((next_id(), topic_id, sub_name, i))
+    insert_units_bulk(units_rows)
+    insert_topics_bulk(topics_rows)
+    insert_subtopics_bulk(subtopics_rows)
 
     return {**get_lesson_plan(course_id), "source": source}
 
@@ -158,7 +186,7 @@ def main() -> None:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
     if args.json:
-        print(json.dumps(plan, indent=2))
+        print(jsonfast.dumps(plan, indent=2))
     else:
         if not plan.get("units"):
             print(plan.get("message", "No units in plan."))
@@ -53,9 +53,12 @@ def run_and_fetch(statement: str) -> list[list[Any]]:
         if data.get("resultSetMetaData") and data.get("data"):
             return data.get("data", [])
         return []
-    # Poll for result
-    for _ in range(30):
-        time.sleep(0.5)
+    # Poll for result with exponential backoff (count queries often finish in <100ms)
+    delay = 0.1
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
         r2 = requests.get(f"{ENDPOINT}/{handle}", headers=_headers())
         r2.raise_for_status()
         d = r2.json()
@@ -67,10 +70,13 @@ def run_and_fetch(statement: str) -> list[list[Any]]:
 def main():
     tables = ["courses", "modules", "documents", "document_chunks"]
     print(f"Database: {SNOWFLAKE_DATABASE}, Schema: {SNOWFLAKE_RAG_SCHEMA}\n")
-    for t in tables:
-        q = f"SELECT COUNT(*) FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.{t}"
-        rows = run_and_fetch(q)
-        count = rows[0][0] if rows else "?"
+    # One statement with a scalar subquery per table: one round-trip, one poll
+    q = "SELECT " + ", ".join(
+        f"(SELECT COUNT(*) FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.{t})" for t in tables
+    )
+    rows = run_and_fetch(q)
+    counts = rows[0] if rows else ["?"] * len(tables)
+    for t, count in zip(tables, counts):
         print(f"  {t}: {count}")
 
 
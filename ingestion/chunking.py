@@ -4,6 +4,10 @@ Chunks never span document boundaries (caller passes one document's text).
 """
 from __future__ import annotations
 
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Iterator
+
 from config import CHUNK_MAX_CHARS, CHUNK_MIN_CHARS, CHUNK_OVERLAP_CHARS
 
 
@@ -16,64 +20,76 @@ def _split_into_paragraphs(text: str) -> list[str]:
     return [p.strip() for p in raw if p.strip()]
 
 
-def chunk_text(text: str) -> list[str]:
+def iter_chunks(text: str) -> Iterator[str]:
     """
-    Split document text into chunks of 800-1200 chars with 150-char overlap.
-    Respects paragraph boundaries (does not break mid-paragraph).
+    Lazily yield chunks of 800-1200 chars with 150-char overlap. Respects
+    paragraph boundaries (does not break mid-paragraph). Chunks stream out as
+    they complete, so callers can process without holding the full list.
     """
     if not text or not text.strip():
-        return []
+        return
+    if len(text) <= CHUNK_MAX_CHARS:
+        # Most Canvas pages fit in one chunk; skip the paragraph machinery
+        s = text.strip()
+        if s:
+            yield s
+        return
     paragraphs = _split_into_paragraphs(text)
     if not paragraphs:
         # No double newlines: treat whole as one block or split by single newlines
         paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
     if not paragraphs:
-        return [text.strip()] if text.strip() else []
+        yield text.strip()
+        return
 
-    chunks = []
-    current: list[str] = []
-    current_len = 0
-    overlap_buffer: list[str] = []  # paragraphs to carry into next chunk for overlap
-    overlap_len = 0
+    # Prefix sums of paragraph lengths (+2 for the "\n\n" joiner): chunk and overlap
+    # boundaries become index arithmetic plus one bisect, instead of re-summing a
+    # rolling buffer per paragraph (which was O(n^2) on long documents).
+    plens = [len(p) + 2 for p in paragraphs]
+    cum = [0, *accumulate(plens)]  # cum[i] = combined length of paragraphs[:i]
 
-    for p in paragraphs:
-        p_len = len(p) + 2  # +2 for "\n\n"
-        if current_len + p_len <= CHUNK_MAX_CHARS:
-            current.append(p)
-            current_len += p_len
-            # Build overlap from the end: keep last paragraphs that fit in CHUNK_OVERLAP_CHARS
-            overlap_buffer.append(p)
-            overlap_len += p_len
-            while overlap_len > CHUNK_OVERLAP_CHARS and len(overlap_buffer) > 1:
-                removed = overlap_buffer.pop(0)
-                overlap_len -= len(removed) + 2
-        else:
-            if current:
-                chunk_text = "\n\n".join(current)
-                if len(chunk_text) >= CHUNK_MIN_CHARS or not chunks:
-                    chunks.append(chunk_text)
-                # Start next chunk with overlap
-                current = list(overlap_buffer)
-                current_len = overlap_len
-                overlap_buffer = list(overlap_buffer)
-                overlap_len = sum(len(x) + 2 for x in overlap_buffer) if overlap_buffer else 0
-            else:
-                # Single paragraph longer than max: split by size
-                start = 0
-                while start < len(p):
-                    end = min(start + CHUNK_MAX_CHARS, len(p))
-                    chunk = p[start:end]
-                    if len(chunk) >= CHUNK_MIN_CHARS or not chunks:
-                        chunks.append(chunk)
-                    start = end - CHUNK_OVERLAP_CHARS if end < len(p) else len(p)
-                current = []
-                current_len = 0
-                overlap_buffer = []
-                overlap_len = 0
+    emitted = False
+    n = len(paragraphs)
+    start = 0  # first paragraph of the chunk being built
+    i = 0  # next paragraph to place
+    while i < n:
+        if cum[i + 1] - cum[start] <= CHUNK_MAX_CHARS:
+            i += 1
+            continue
+        if i == start:
+            # Single paragraph longer than max: split by size
+            p = paragraphs[i]
+            pos = 0
+            while pos < len(p):
+                end = min(pos + CHUNK_MAX_CHARS, len(p))
+                piece = p[pos:end]
+                if len(piece) >= CHUNK_MIN_CHARS or not emitted:
+                    yield piece
+                    emitted = True
+                pos = end - CHUNK_OVERLAP_CHARS if end < len(p) else len(p)
+            i += 1
+            start = i
+            continue
+        # Flush paragraphs[start:i] as a chunk
+        chunk = "\n\n".join(paragraphs[start:i])
+        if len(chunk) >= CHUNK_MIN_CHARS or not emitted:
+            yield chunk
+            emitted = True
+        # Overlap for the next chunk: the smallest tail of the flushed chunk that
+        # fits CHUNK_OVERLAP_CHARS, but always at least the last paragraph.
+        o = bisect_left(cum, cum[i] - CHUNK_OVERLAP_CHARS)
+        o = min(max(o, start), i - 1)
+        if cum[i + 1] - cum[o] > CHUNK_MAX_CHARS:
+            # Overlap plus the pending paragraph would exceed max: start fresh
+            o = i
+        start = o
 
-    if current:
-        chunk_text = "\n\n".join(current)
-        if chunk_text and (len(chunk_text) >= CHUNK_MIN_CHARS or not chunks):
-            chunks.append(chunk_text)
+    if start < n:
+        chunk = "\n\n".join(paragraphs[start:n])
+        if chunk and (len(chunk) >= CHUNK_MIN_CHARS or not emitted):
+            yield chunk
 
-    return chunks
+
+def chunk_text(text: str) -> list[str]:
+    """List form of iter_chunks, for callers that need the whole document."""
+    return list(iter_chunks(text))
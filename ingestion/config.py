@@ -36,11 +36,14 @@ CHUNK_OVERLAP_CHARS = 150
 # Embedding (Gemini; 768 dims for Snowflake storage)
 GEMINI_EMBEDDING_MODEL = "models/gemini-embedding-001"
 GEMINI_EMBEDDING_DIM = 768
-EMBED_BATCH_SIZE = 50  # texts per API call for batch embedding (ingestion)
+EMBED_BATCH_SIZE = 100  # texts per API call (Gemini Developer API caps batch embedding at 100 inputs)
 
 # Generation (practice questions)
 GEMINI_GENERATION_MODEL = "gemini-2.0-flash"
 RETRIEVAL_TOP_K = 8
 RETRIEVAL_THRESHOLD = 0.25
 RETRIEVAL_MIN_CHUNKS = 2
+# Opt-in: score retrieval locally against an in-process embedding cache
+# instead of in the warehouse (needs numpy; see snowflake_rag.retrieve_chunks)
+RETRIEVAL_LOCAL_CACHE = get_env("RETRIEVAL_LOCAL_CACHE").lower() in ("1", "true", "yes")
 FAILURE_MESSAGE = "Not enough course material available to generate meaningful practice questions."
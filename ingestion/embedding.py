@@ -3,11 +3,15 @@ Gemini embedding via google-genai (non-deprecated): one model for documents and
 """
 from __future__ import annotations
 
+import math
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 from google import genai
 from google.genai import types
 
+import embedding_cache
 from config import (
     EMBED_BATCH_SIZE,
     GEMINI_EMBEDDING_DIM,
@@ -18,6 +22,9 @@ from config import (
 # Reused client (uses GEMINI_API_KEY or GOOGLE_API_KEY from env if not passed)
 _client: genai.Client | None = None
 
+# Batches embedded concurrently (each is one HTTPS round-trip; the work is I/O wait)
+EMBED_MAX_CONCURRENCY = 8
+
 
 def _client_get() -> genai.Client:
     global _client
@@ -28,6 +35,15 @@ def _client_get() -> genai.Client:
     return _client
 
 
+def init() -> None:
+    """
+    Instantiate the shared client eagerly. Callers with a per-item loop (or a
+    latency-sensitive single call) invoke this up front so client construction
+    and connection setup happen outside the hot path.
+    """
+    _client_get()
+
+
 def embed_text(text: str) -> list[float]:
     """Return 768-dim embedding for a single string. Truncates if model returns more."""
     client = _client_get()
@@ -39,48 +55,97 @@ def embed_text(text: str) -> list[float]:
     # Response has .embeddings (list); single content -> embeddings[0], with .values or direct list
     if not response.embeddings:
         raise RuntimeError("No embeddings in response")
-    first = response.embeddings[0]
-    emb = list(getattr(first, "values", first) if not isinstance(first, (list, tuple)) else first)
-    if len(emb) > GEMINI_EMBEDDING_DIM:
-        emb = emb[:GEMINI_EMBEDDING_DIM]
-    return emb
+    return _parse_embedding(response.embeddings[0])
+
+
+def _normalize(emb: list[float]) -> list[float]:
+    """
+    Scale to unit length. Every vector leaves this module normalized, so
+    retrieval can use a plain dot product instead of cosine (no per-row
+    norm/sqrt at query time). No-op on already-normalized input.
+    """
+    norm = math.sqrt(math.fsum(x * x for x in emb))
+    if norm <= 0.0:
+        return emb
+    inv = 1.0 / norm
+    return [x * inv for x in emb]
 
 
 def _parse_embedding(item: Any) -> list[float]:
-    """Turn one response.embeddings[i] into list[float]."""
+    """Turn one response.embeddings[i] into a normalized list[float]."""
     emb = list(getattr(item, "values", item) if not isinstance(item, (list, tuple)) else item)
     if len(emb) > GEMINI_EMBEDDING_DIM:
         emb = emb[:GEMINI_EMBEDDING_DIM]
-    return emb
+    return _normalize(emb)
+
+
+def _embed_one_batch(client: genai.Client, config: types.EmbedContentConfig, batch: list[str]) -> list[list[float]]:
+    """Embed one batch via multi-content embed_content; fall back to per-text calls on failure."""
+    normalized = [(t.strip() or " ") for t in batch]
+    try:
+        response = client.models.embed_content(
+            model=GEMINI_EMBEDDING_MODEL,
+            contents=normalized,
+            config=config,
+        )
+        if not response.embeddings or len(response.embeddings) != len(batch):
+            raise RuntimeError(
+                f"Unexpected embeddings count: got {len(response.embeddings or [])}, expected {len(batch)}"
+            )
+        return [_parse_embedding(item) for item in response.embeddings]
+    except Exception as e:
+        # Fallback: one API call per text in this batch. Loud on purpose —
+        # if this engages on every batch (e.g. a batch size over the API
+        # limit) embedding silently degrades to per-text round-trips
+        print(
+            f"Warning: batch embed of {len(batch)} texts failed ({e}); falling back to per-text calls",
+            file=sys.stderr,
+        )
+        return [embed_text(t) for t in batch]
+
+
+def _embed_all_batches(texts: list[str]) -> list[list[float]]:
+    """Embed texts in EMBED_BATCH_SIZE windows, dispatched concurrently, in input order."""
+    client = _client_get()
+    config = types.EmbedContentConfig(output_dimensionality=GEMINI_EMBEDDING_DIM)
+    batches = [texts[start : start + EMBED_BATCH_SIZE] for start in range(0, len(texts), EMBED_BATCH_SIZE)]
+    if len(batches) == 1:
+        return _embed_one_batch(client, config, batches[0])
+    result: list[list[float]] = []
+    with ThreadPoolExecutor(max_workers=min(EMBED_MAX_CONCURRENCY, len(batches))) as pool:
+        for embs in pool.map(lambda b: _embed_one_batch(client, config, b), batches):
+            result.extend(embs)
+    return result
 
 
 def embed_texts_batch(texts: list[str]) -> list[list[float]]:
     """
-    Embed multiple texts in batches (fewer API calls). Uses Gemini multi-content
-    embed_content; on batch failure, falls back to per-text embed_text for that batch.
+    Embed multiple texts in batches (fewer API calls). Identical texts (course
+    boilerplate, repeated headers) are embedded once and the vector is reused
+    for every occurrence; vectors are also persisted in the on-disk cache so
+    reruns only pay for texts not seen before. Batches are dispatched
+    concurrently (up to EMBED_MAX_CONCURRENCY in flight); results come back in
+    input order.
     """
     if not texts:
         return []
-    client = _client_get()
-    config = types.EmbedContentConfig(output_dimensionality=GEMINI_EMBEDDING_DIM)
-    result: list[list[float]] = []
-    for start in range(0, len(texts), EMBED_BATCH_SIZE):
-        batch = texts[start : start + EMBED_BATCH_SIZE]
-        normalized = [(t.strip() or " ") for t in batch]
-        try:
-            response = client.models.embed_content(
-                model=GEMINI_EMBEDDING_MODEL,
-                contents=normalized,
-                config=config,
-            )
-            if not response.embeddings or len(response.embeddings) != len(batch):
-                raise RuntimeError(
-                    f"Unexpected embeddings count: got {len(response.embeddings or [])}, expected {len(batch)}"
-                )
-            for item in response.embeddings:
-                result.append(_parse_embedding(item))
-        except Exception:
-            # Fallback: one API call per text in this batch
-            for t in batch:
-                result.append(embed_text(t))
-    return result
+    normalized = [(t.strip() or " ") for t in texts]
+    index_of: dict[str, int] = {}
+    unique: list[str] = []
+    for t in normalized:
+        if t not in index_of:
+            index_of[t] = len(unique)
+            unique.append(t)
+    keys = [embedding_cache.cache_key(GEMINI_EMBEDDING_MODEL, GEMINI_EMBEDDING_DIM, t) for t in unique]
+    cached = embedding_cache.get_many(keys)
+    misses = [t for t, k in zip(unique, keys) if k not in cached]
+    if misses:
+        fresh = iter(_embed_all_batches(misses))
+        new_items: dict[str, list[float]] = {}
+        for t, k in zip(unique, keys):
+            if k not in cached:
+                cached[k] = new_items[k] = next(fresh)
+        embedding_cache.put_many(new_items)
+    # Normalize on the way out too: vectors cached before normalization landed
+    # are stored raw, and re-normalizing a unit vector is a no-op
+    return [_normalize(cached[keys[index_of[t]]]) for t in normalized]
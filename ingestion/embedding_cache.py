@@ -0,0 +1,95 @@
+"""
+Persistent embedding cache: sqlite under ingestion/.cache, keyed by
+sha256(model|dim|text). Vectors are stored as raw float32 bytes, so reruns and
+cross-course duplicates skip the embedding API entirely.
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+from array import array
+from pathlib import Path
+
+CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+_DB_PATH = CACHE_DIR / "embeddings.db"
+
+# sqlite caps bound parameters per statement; chunk IN (...) lookups accordingly
+_LOOKUP_SLICE = 500
+
+# Entries beyond this are evicted least-recently-used after each write.
+# 200k rows of 768 float32 dims is ~600 MB, a sane ceiling for a local cache.
+CACHE_CAPACITY = 200_000
+
+_conn: sqlite3.Connection | None = None
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        CACHE_DIR.mkdir(exist_ok=True)
+        _conn = sqlite3.connect(_DB_PATH, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS embed_cache ("
+            " key TEXT PRIMARY KEY,"
+            " vec BLOB NOT NULL,"
+            " created_at INT DEFAULT (strftime('%s','now')))"
+        )
+        try:
+            _conn.execute("ALTER TABLE embed_cache ADD COLUMN last_used INT")
+        except sqlite3.OperationalError:
+            pass  # column already present (db created after this migration)
+        _conn.commit()
+    return _conn
+
+
+def cache_key(model: str, dim: int, text: str) -> str:
+    return hashlib.sha256(f"{model}|{dim}|{text}".encode()).hexdigest()
+
+
+def get_many(keys: list[str]) -> dict[str, list[float]]:
+    """Return key -> vector for every cached key; misses are simply absent."""
+    if not keys:
+        return {}
+    conn = _connect()
+    out: dict[str, list[float]] = {}
+    for start in range(0, len(keys), _LOOKUP_SLICE):
+        batch = keys[start : start + _LOOKUP_SLICE]
+        rows = conn.execute(
+            f"SELECT key, vec FROM embed_cache WHERE key IN ({','.join('?' * len(batch))})",
+            batch,
+        ).fetchall()
+        for key, blob in rows:
+            out[key] = array("f", blob).tolist()
+    if out:
+        # Touch hits so eviction is least-recently-used, not insertion order
+        hit_keys = list(out)
+        for start in range(0, len(hit_keys), _LOOKUP_SLICE):
+            batch = hit_keys[start : start + _LOOKUP_SLICE]
+            conn.execute(
+                "UPDATE embed_cache SET last_used = strftime('%s','now')"
+                f" WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+        conn.commit()
+    return out
+
+
+def put_many(items: dict[str, list[float]]) -> None:
+    """Store key -> vector pairs in one transaction (amortizes the fsync)."""
+    if not items:
+        return
+    conn = _connect()
+    conn.executemany(
+        "INSERT OR REPLACE INTO embed_cache (key, vec, last_used)"
+        " VALUES (?, ?, strftime('%s','now'))",
+        [(k, array("f", v).tobytes()) for k, v in items.items()],
+    )
+    (count,) = conn.execute("SELECT COUNT(*) FROM embed_cache").fetchone()
+    if count > CACHE_CAPACITY:
+        conn.execute(
+            "DELETE FROM embed_cache WHERE key IN ("
+            " SELECT key FROM embed_cache"
+            " ORDER BY COALESCE(last_used, created_at) LIMIT ?)",
+            (count - CACHE_CAPACITY,),
+        )
+    conn.commit()
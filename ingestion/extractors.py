@@ -4,30 +4,130 @@ Extract plain text from HTML (Canvas pages, assignment descriptions) and from bi
 from __future__ import annotations
 
 import io
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from html import unescape
+from itertools import repeat
+from typing import BinaryIO
 
 from bs4 import BeautifulSoup
 from pypdf import PdfReader
 
+try:
+    # selectolax (lexbor) parses in C, 10-30x faster than html.parser on big pages
+    from selectolax.parser import HTMLParser as LexborParser
+except ImportError:
+    LexborParser = None
+
+try:
+    # When the bs4 fallback runs, the C-backed lxml parser still beats html.parser
+    import lxml  # noqa: F401
+
+    _BS4_PARSER = "lxml"
+except ImportError:
+    _BS4_PARSER = "html.parser"
+
+
+_WS_RE = re.compile(r"\s+")
+
 
 def html_to_text(html: str | None) -> str:
     """Strip tags and return plain text. Handles None and empty."""
     if not html or not html.strip():
         return ""
-    soup = BeautifulSoup(html, "html.parser")
-    # Remove script/style
-    for tag in soup(["script", "style"]):
-        tag.decompose()
-    text = soup.get_text(separator="\n")
-    lines = (line.strip() for line in text.splitlines())
-    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-    return unescape(" ".join(chunk for chunk in chunks if chunk))
-
-
-def pdf_to_text(data: bytes) -> str:
-    """Extract text from PDF bytes. Skips bad pages; returns empty string if whole PDF fails."""
+    if LexborParser is not None:
+        tree = LexborParser(html)
+        for tag in tree.css("script,style"):
+            tag.decompose()
+        text = tree.text(separator="\n")
+    else:
+        soup = BeautifulSoup(html, _BS4_PARSER)
+        # Remove script/style
+        for tag in soup(["script", "style"]):
+            tag.decompose()
+        text = soup.get_text(separator="\n")
+    # One C-level pass collapses all runs of whitespace (same result as the old
+    # per-line/per-phrase generator chain, without the Python-loop cost)
+    return unescape(_WS_RE.sub(" ", text).strip())
+
+
+# Page extraction is CPU-bound pure Python inside pypdf; PDFs with at least this
+# many pages are split across a process pool (threads would serialize on the GIL).
+PDF_PARALLEL_MIN_PAGES = 8
+
+# One shared pool for all PDFs, created lazily with the spawn start method:
+# pdf_to_text is called from ingest_course's download threads, and forking a
+# process that already runs threads and TLS sessions can deadlock the child
+# on inherited locks. A single pool also caps total workers at cpu_count
+# instead of one full-sized pool per concurrently-downloaded PDF.
+_PDF_POOL: ProcessPoolExecutor | None = None
+_PDF_POOL_LOCK = threading.Lock()
+
+
+def _pdf_pool() -> ProcessPoolExecutor:
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is None:
+            _PDF_POOL = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _PDF_POOL
+
+
+def _extract_page_range(data: bytes, start: int, stop: int) -> list[str]:
+    """Process-pool worker: extract text from pages [start, stop). Skips bad pages."""
+    reader = PdfReader(io.BytesIO(data))
+    parts = []
+    for idx in range(start, stop):
+        try:
+            t = reader.pages[idx].extract_text()
+            if t:
+                parts.append(t)
+        except Exception:
+            continue
+    return parts
+
+
+def _pdf_to_text_parallel(data: bytes, num_pages: int) -> str:
+    """Extract all pages via the shared process pool, one contiguous page range per task."""
+    workers = min(os.cpu_count() or 1, num_pages)
+    step = -(-num_pages // workers)  # ceil division
+    starts = list(range(0, num_pages, step))
+    stops = [min(s + step, num_pages) for s in starts]
+    parts: list[str] = []
+    for range_parts in _pdf_pool().map(_extract_page_range, repeat(data), starts, stops):
+        parts.extend(range_parts)
+    return "\n\n".join(parts)
+
+
+def pdf_to_text(data: bytes | BinaryIO) -> str:
+    """
+    Extract text from a PDF given as bytes or a seekable binary file object
+    (e.g. the spooled download buffer — no extra in-memory copy is made).
+    Skips bad pages; returns empty string if the whole PDF fails.
+    """
+    try:
+        stream = io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+        reader = PdfReader(stream)
+        num_pages = len(reader.pages)
+    except Exception:
+        return ""
+    if num_pages >= PDF_PARALLEL_MIN_PAGES and (os.cpu_count() or 1) > 1:
+        try:
+            if isinstance(data, (bytes, bytearray)):
+                raw = bytes(data)
+            else:
+                data.seek(0)
+                raw = data.read()
+            return _pdf_to_text_parallel(raw, num_pages)
+        except Exception:
+            pass  # e.g. environments where worker processes can't spawn
     try:
-        reader = PdfReader(io.BytesIO(data))
         parts = []
         for page in reader.pages:
             try:
@@ -41,7 +141,19 @@ def pdf_to_text(data: bytes) -> str:
         return ""
 
 
-def extract_text_from_file(data: bytes, filename: str) -> str:
+def pdf_to_text_path(path: str) -> str:
+    """
+    Extract text from a PDF already on disk. The file is memory-mapped, so pypdf
+    reads through the kernel page cache instead of a full in-memory copy.
+    """
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return pdf_to_text(mm)
+    except Exception:
+        return ""
+
+
+def extract_text_from_file(data: bytes | BinaryIO, filename: str) -> str:
     """
     Dispatch by extension. Supports PDF. Other types return empty (can add docx, etc. later).
     """
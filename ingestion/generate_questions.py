@@ -8,14 +8,13 @@ Usage:
 from __future__ import annotations
 
 import argparse
-import json
-import re
 import sys
 from typing import Any
 
 from google import genai
 from google.genai import types
 
+import jsonfast
 from config import (
     FAILURE_MESSAGE,
     GEMINI_API_KEY,
@@ -39,30 +38,19 @@ def _get_client() -> genai.Client:
     return _client
 
 
-def _build_rag_prompt(chunks: list[dict[str, Any]], query: str, num_questions: int) -> str:
-    """Build prompt that injects retrieved chunks so Gemini uses only that material."""
-    material_lines = []
-    for i, c in enumerate(chunks, 1):
-        chunk_id = c.get("chunk_id") or ""
-        doc_title = c.get("document_title") or "Unknown document"
-        course_name = c.get("course_name") or ""
-        module_name = c.get("module_name") or ""
-        text = (c.get("text") or "").strip()
-        material_lines.append(
-            f"[Source {i}] (chunk_id: {chunk_id})\n"
-            f"  Course: {course_name} | Module: {module_name} | Document: {doc_title}\n"
-            f"  Content:\n{text}\n"
-        )
-    material_block = "\n".join(material_lines)
-    return f"""You are a practice question generator for a course. Use ONLY the following course material to generate {num_questions} practice questions. Do not use external knowledge.
-
-Topic/query from the user: {query}
+# Fixed prompt fragments live at module scope; _build_rag_prompt only fills in
+# the query, question count, and material block
+_PROMPT_HEAD = (
+    "You are a practice question generator for a course. Use ONLY the following"
+    " course material to generate {n} practice questions. Do not use external knowledge."
+    "\n\nTopic/query from the user: "
+)
 
-Course material (each has a chunk_id for citation):
-{material_block}
+_PROMPT_MATERIAL = "\n\nCourse material (each has a chunk_id for citation):\n"
 
+_PROMPT_FOOTER = """
 Instructions:
-- Generate exactly {num_questions} questions that test understanding of the material above.
+- Generate exactly {n} questions that test understanding of the material above.
 - Use a mix of short-answer and multiple-choice questions where appropriate.
 - Each question must be answerable from the material above only.
 - For each question, you MUST cite one or more chunk_ids from the list above (e.g. source_chunk_ids: ["<chunk_id>"]).
@@ -76,23 +64,45 @@ Instructions:
 Return only valid JSON, no markdown or extra text."""
 
 
+def _build_rag_prompt(chunks: list[dict[str, Any]], query: str, num_questions: int) -> str:
+    """Build prompt that injects retrieved chunks so Gemini uses only that material."""
+    parts = [_PROMPT_HEAD.format(n=num_questions), query, _PROMPT_MATERIAL]
+    for i, c in enumerate(chunks, 1):
+        chunk_id = c.get("chunk_id") or ""
+        doc_title = c.get("document_title") or "Unknown document"
+        course_name = c.get("course_name") or ""
+        module_name = c.get("module_name") or ""
+        text = (c.get("text") or "").strip()
+        parts.append(
+            f"[Source {i}] (chunk_id: {chunk_id})\n"
+            f"  Course: {course_name} | Module: {module_name} | Document: {doc_title}\n"
+            f"  Content:\n{text}\n\n"
+        )
+    parts.append(_PROMPT_FOOTER.format(n=num_questions))
+    return "".join(parts)
+
+
 def _parse_questions_json(text: str) -> list[dict[str, Any]]:
     """Extract JSON from model output (may be wrapped in markdown)."""
     text = (text or "").strip()
-    # Remove markdown code block if present
-    m = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
-    if m:
-        text = m.group(1).strip()
+    # Most responses are already bare JSON; when a fence is present, a
+    # partition scan pulls out the first block without regex machinery
+    if "```" in text:
+        _, _, rest = text.partition("```")
+        if rest.startswith("json"):
+            rest = rest[4:]
+        body, _, _ = rest.partition("```")
+        text = body.strip()
     try:
-        data = json.loads(text)
+        data = jsonfast.loads(text)
         return data.get("questions") if isinstance(data, dict) else []
-    except json.JSONDecodeError:
+    except ValueError:
         return []
 
 
-def _validate_citations(questions: list[dict], valid_chunk_ids: set[str]) -> list[dict]:
+def _validate_citations(questions: list[dict], valid_chunk_ids: frozenset[str]) -> list[dict]:
     """Ensure each question's source_chunk_ids are in the retrieved set; filter invalid."""
-    valid_chunk_ids = valid_chunk_ids or set()
+    valid_chunk_ids = valid_chunk_ids or frozenset()
     out = []
     for q in questions:
         cited = q.get("source_chunk_ids") or []
@@ -106,21 +116,24 @@ def _validate_citations(questions: list[dict], valid_chunk_ids: set[str]) -> lis
 
 def _add_readable_sources(questions: list[dict], chunks_by_id: dict[str, dict]) -> list[dict]:
     """Add source_display (human-readable) to each question."""
+    # Each chunk's display string is built once; questions citing the same
+    # chunk (the common case) just look it up
+    display_for_cid = {
+        cid: " | ".join(
+            p
+            for p in (
+                c.get("course_name") or "",
+                c.get("module_name") or "",
+                c.get("document_title") or cid,
+            )
+            if p
+        )
+        for cid, c in chunks_by_id.items()
+    }
     for q in questions:
-        cited = q.get("source_chunk_ids") or []
-        displays = []
-        for cid in cited:
-            c = chunks_by_id.get(cid)
-            if c:
-                parts = [
-                    c.get("course_name") or "",
-                    c.get("module_name") or "",
-                    c.get("document_title") or cid,
-                ]
-                displays.append(" | ".join(p for p in parts if p))
-            else:
-                displays.append(cid)
-        q["source_display"] = displays
+        q["source_display"] = [
+            display_for_cid.get(cid, cid) for cid in q.get("source_chunk_ids") or ()
+        ]
     return questions
 
 
@@ -154,15 +167,18 @@ def generate_questions(
 
     prompt = _build_rag_prompt(chunks, query.strip(), num_questions)
     client = _get_client()
-    response = client.models.generate_content(
+    # Stream the response: tokens are consumed as they arrive instead of
+    # blocking for the full generation before anything is read off the socket
+    stream = client.models.generate_content_stream(
         model=GEMINI_GENERATION_MODEL,
         contents=prompt,
     )
-    text = response.text if hasattr(response, "text") else str(response)
+    text = "".join(piece.text for piece in stream if piece.text)
     questions = _parse_questions_json(text)
-    valid_ids = {c["chunk_id"] for c in chunks}
-    questions = _validate_citations(questions, valid_ids)
-    chunks_by_id = {c["chunk_id"]: c for c in chunks}
+    # One pass over chunks feeds both citation validation and display lookup
+    chunk_ids = [c["chunk_id"] for c in chunks]
+    chunks_by_id = dict(zip(chunk_ids, chunks))
+    questions = _validate_citations(questions, frozenset(chunk_ids))
     questions = _add_readable_sources(questions, chunks_by_id)
 
     return {"questions": questions, "retrieved_chunk_count": len(chunks)}
@@ -178,6 +194,7 @@ def main() -> None:
     ap.add_argument("--subtopic-id", type=str, default="", help="Limit retrieval to this subtopic")
     args = ap.parse_args()
 
+    _get_client()  # client/TLS setup up front, outside the generation path
     result = generate_questions(
         course_id=args.course_id,
         query=args.query,
@@ -189,7 +206,7 @@ def main() -> None:
     if result.get("error"):
         print(result["error"], file=sys.stderr)
         sys.exit(1)
-    print(json.dumps(result, indent=2))
+    print(jsonfast.dumps(result, indent=2))
 
 
 if __name__ == "__main__":
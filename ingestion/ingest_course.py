@@ -7,7 +7,10 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import queue
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 from canvas_client import (
@@ -21,34 +24,74 @@ from canvas_client import (
     fetch_syllabus,
 )
 from chunking import chunk_text
+import embedding
 from config import CANVAS_API_KEY
 from embedding import embed_texts_batch
 from extractors import extract_text_from_file, html_to_text
 from snowflake_rag import (
     delete_chunks_by_document_id,
     ensure_rag_schema,
-    generate_chunk_id,
-    insert_chunk,
+    generate_chunk_ids,
+    insert_chunks_batch,
     insert_course,
     insert_document,
     insert_module,
 )
 
 
-def _module_item_map(modules: list[dict]) -> dict[tuple[str, str], str]:
-    """(content_type, content_id) -> module_id. Content type: Assignment, File, Page, etc."""
-    out = {}
+# Document batches buffered between the fetch/extract side and the embed/store
+# side. Bounded so a fast producer can't pile raw text for a whole course in memory.
+PIPELINE_QUEUE_SIZE = 4
+
+# Concurrent Canvas calls for per-item fetches (page bodies, file downloads);
+# each is a blocking HTTPS round-trip, so threads overlap almost perfectly.
+CANVAS_PARALLELISM = 16
+
+# Chunks accumulated across documents before one embed+store batch is dispatched.
+# Many short documents share embedding round-trips instead of paying one each.
+EMBED_FLUSH_CHUNKS = 256
+
+
+def _ingest_worker(jobs: queue.Queue, errors: list[Exception]) -> None:
+    """
+    Consumer thread: embeds and stores document batches as the main thread keeps
+    fetching the next ones. After a failure it keeps draining (without
+    processing) so the producer never blocks on a full queue.
+    """
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        if errors:
+            continue
+        try:
+            _ingest_batch(job)
+        except Exception as e:
+            errors.append(e)
+
+
+def _build_module_maps(
+    modules: list[dict],
+) -> tuple[dict[tuple[str, str], str], dict[str, str]]:
+    """
+    One pass over modules building both lookups: (content_type, content_id) ->
+    module_id (content type: Assignment, File, Page, etc.) and module_id ->
+    display name.
+    """
+    item_map: dict[tuple[str, str], str] = {}
+    name_by_id: dict[str, str] = {}
     for mod in modules:
         mod_id = str(mod.get("id") or "")
-        for item in mod.get("items") or []:
+        name_by_id[mod_id] = (mod.get("name") or "").strip() or mod_id
+        for item in mod.get("items") or ():
             ctype = (item.get("type") or "").strip()
             cid = str(item.get("content_id") or item.get("page_url") or "")
             if ctype and cid:
-                out[(ctype, cid)] = mod_id
-    return out
+                item_map[(ctype, cid)] = mod_id
+    return item_map, name_by_id
 
 
-def _ingest_document(
+def _make_doc_entry(
     course_id: str,
     module_id: str,
     document_id: str,
@@ -57,37 +100,76 @@ def _ingest_document(
     raw_text: str,
     course_name: str = "",
     module_name: str = "",
-) -> None:
+) -> dict | None:
+    """Chunk one document and package it for a batch; None if there is no text."""
     if not raw_text or not raw_text.strip():
-        return
-    display_title = (title or document_id).strip()[:60]
+        return None
+    chunks = chunk_text(raw_text)
+    if not chunks:
+        return None
+    return {
+        "course_id": course_id,
+        "module_id": module_id or "uncategorized",
+        "document_id": document_id,
+        "document_type": document_type,
+        "title": title or document_id,
+        "raw_text": raw_text,
+        "course_name": course_name,
+        "module_name": module_name,
+        "chunks": chunks,
+    }
+
+
+def _insert_document_with_embeddings(
+    entry: dict, embeddings: list[list[float]]
+) -> None:
+    """Store one already-embedded document: document row, then its chunk rows."""
+    document_id = entry["document_id"]
     insert_document(
         document_id=document_id,
-        course_id=course_id,
-        module_id=module_id or "uncategorized",
-        document_type=document_type,
-        title=title or document_id,
-        raw_text=raw_text,
+        course_id=entry["course_id"],
+        module_id=entry["module_id"],
+        document_type=entry["document_type"],
+        title=entry["title"],
+        raw_text=entry["raw_text"],
     )
     delete_chunks_by_document_id(document_id)
-    document_title = title or document_id
-    chunks = chunk_text(raw_text)
-    print(f"    embedding {len(chunks)} chunks: {display_title}...", flush=True)
-    embeddings = embed_texts_batch(chunks)
-    for chunk_text_val, embedding in zip(chunks, embeddings):
-        chunk_id = generate_chunk_id()
-        insert_chunk(
-            chunk_id=chunk_id,
-            document_id=document_id,
-            course_id=course_id,
-            module_id=module_id or "uncategorized",
-            text=chunk_text_val,
-            embedding=embedding,
-            document_title=document_title,
-            course_name=course_name,
-            module_name=module_name,
-        )
-    print(f"    stored {len(chunks)} chunks: {display_title}", flush=True)
+    chunk_ids = generate_chunk_ids(len(entry["chunks"]))
+    insert_chunks_batch(
+        [
+            dict(
+                chunk_id=chunk_id,
+                document_id=document_id,
+                course_id=entry["course_id"],
+                module_id=entry["module_id"],
+                text=chunk_text_val,
+                embedding=embedding,
+                document_title=entry["title"],
+                course_name=entry["course_name"],
+                module_name=entry["module_name"],
+            )
+            for chunk_id, chunk_text_val, embedding in zip(
+                chunk_ids, entry["chunks"], embeddings
+            )
+        ]
+    )
+    display_title = entry["title"].strip()[:60]
+    print(f"    stored {len(entry['chunks'])} chunks: {display_title}", flush=True)
+
+
+def _ingest_batch(batch: list[dict]) -> None:
+    """Embed every chunk in the batch in one shot, then store per document."""
+    flat = [c for entry in batch for c in entry["chunks"]]
+    print(
+        f"    embedding {len(flat)} chunks across {len(batch)} document(s)...",
+        flush=True,
+    )
+    embeddings = embed_texts_batch(flat)
+    offset = 0
+    for entry in batch:
+        n = len(entry["chunks"])
+        _insert_document_with_embeddings(entry, embeddings[offset : offset + n])
+        offset += n
 
 
 def ingest_course(course_id_arg: str | None = None) -> None:
@@ -97,6 +179,7 @@ def ingest_course(course_id_arg: str | None = None) -> None:
         sys.exit(1)
 
     print("Setting up RAG schema...", flush=True)
+    embedding.init()  # build the Gemini client before the per-document loop
     ensure_rag_schema()
     print("Fetching courses from Canvas...", flush=True)
     courses = fetch_courses(token)
@@ -107,6 +190,38 @@ def ingest_course(course_id_arg: str | None = None) -> None:
             sys.exit(1)
     print(f"Found {len(courses)} course(s).", flush=True)
 
+    # Pipeline: the main thread downloads/extracts while the worker embeds and
+    # stores the previous documents, so wall time tracks the slower stage
+    # instead of their sum.
+    jobs: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    errors: list[Exception] = []
+    worker = threading.Thread(target=_ingest_worker, args=(jobs, errors), daemon=True)
+    worker.start()
+
+    # Documents accumulate here until EMBED_FLUSH_CHUNKS worth of chunks are
+    # ready, then go to the worker as one cross-document embed batch.
+    pending: list[dict] = []
+    pending_chunks = 0
+
+    def queue_doc(**doc_kwargs: Any) -> None:
+        nonlocal pending, pending_chunks
+        entry = _make_doc_entry(**doc_kwargs)
+        if entry is None:
+            return
+        pending.append(entry)
+        pending_chunks += len(entry["chunks"])
+        if pending_chunks >= EMBED_FLUSH_CHUNKS:
+            jobs.put(pending)
+            pending = []
+            pending_chunks = 0
+
+    def flush_docs() -> None:
+        nonlocal pending, pending_chunks
+        if pending:
+            jobs.put(pending)
+            pending = []
+            pending_chunks = 0
+
     for course in courses:
         cid = str(course["id"])
         cname = (course.get("name") or "").strip() or cid
@@ -115,24 +230,16 @@ def ingest_course(course_id_arg: str | None = None) -> None:
 
         print("  Fetching modules...", flush=True)
         modules = fetch_modules(token, cid)
-        item_map = _module_item_map(modules)
-        module_name_by_id = {
-            str(mod["id"]): (mod.get("name") or "").strip() or str(mod["id"])
-            for mod in modules
-        }
-        for mod in modules:
-            insert_module(
-                module_id=str(mod["id"]),
-                course_id=cid,
-                module_name=(mod.get("name") or "").strip() or str(mod["id"]),
-            )
+        item_map, module_name_by_id = _build_module_maps(modules)
+        for mod_id, mod_name in module_name_by_id.items():
+            insert_module(module_id=mod_id, course_id=cid, module_name=mod_name)
 
         # Syllabus
         print("  Fetching syllabus...", flush=True)
         syllabus_html = fetch_syllabus(token, cid)
         if syllabus_html:
             text = html_to_text(syllabus_html)
-            _ingest_document(
+            queue_doc(
                 course_id=cid,
                 module_id="",
                 document_id=f"syllabus_{cid}",
@@ -153,7 +260,7 @@ def ingest_course(course_id_arg: str | None = None) -> None:
                 continue
             doc_id = f"assignment_{a['id']}"
             mod_id = item_map.get(("Assignment", str(a["id"])), "")
-            _ingest_document(
+            queue_doc(
                 course_id=cid,
                 module_id=mod_id,
                 document_id=doc_id,
@@ -164,22 +271,23 @@ def ingest_course(course_id_arg: str | None = None) -> None:
                 module_name=module_name_by_id.get(mod_id, "") if mod_id else "",
             )
 
-        # Pages (body HTML)
+        # Pages (body HTML) — bodies are fetched concurrently, ingested in order
         pages = fetch_pages(token, cid)
         print(f"  Ingesting {len(pages)} page(s)...", flush=True)
-        for p in pages:
-            url_slug = p.get("url") or p.get("page_id") or ""
-            if not url_slug:
-                continue
-            body = fetch_page_body(token, cid, url_slug)
-            if not body:
+        slugs = [p.get("url") or p.get("page_id") or "" for p in pages]
+        with ThreadPoolExecutor(max_workers=CANVAS_PARALLELISM) as pool:
+            bodies = list(
+                pool.map(lambda s: fetch_page_body(token, cid, s) if s else None, slugs)
+            )
+        for p, url_slug, body in zip(pages, slugs, bodies):
+            if not url_slug or not body:
                 continue
             text = html_to_text(body)
             if not text.strip():
                 continue
             doc_id = f"page_{cid}_{url_slug}"
             mod_id = item_map.get(("Page", url_slug), "")
-            _ingest_document(
+            queue_doc(
                 course_id=cid,
                 module_id=mod_id,
                 document_id=doc_id,
@@ -190,23 +298,31 @@ def ingest_course(course_id_arg: str | None = None) -> None:
                 module_name=module_name_by_id.get(mod_id, "") if mod_id else "",
             )
 
-        # Files (download and extract text)
+        # Files — download and extract concurrently, ingest in order
         files = fetch_files(token, cid)
         print(f"  Downloading & ingesting {len(files)} file(s)...", flush=True)
-        for f in files:
+
+        def _fetch_file_text(f: dict) -> str:
             url = f.get("url")
             if not url:
-                continue
+                return ""
             raw = download_file(token, url)
-            if not raw:
-                continue
+            if raw is None:
+                return ""
             filename = f.get("display_name") or f.get("filename") or ""
             text = extract_text_from_file(raw, filename)
+            raw.close()
+            return text
+
+        with ThreadPoolExecutor(max_workers=CANVAS_PARALLELISM) as pool:
+            file_texts = list(pool.map(_fetch_file_text, files))
+        for f, text in zip(files, file_texts):
             if not text.strip():
                 continue
+            filename = f.get("display_name") or f.get("filename") or ""
             doc_id = f"file_{f['id']}"
             mod_id = item_map.get(("File", str(f["id"])), "")
-            _ingest_document(
+            queue_doc(
                 course_id=cid,
                 module_id=mod_id,
                 document_id=doc_id,
@@ -217,6 +333,13 @@ def ingest_course(course_id_arg: str | None = None) -> None:
                 module_name=module_name_by_id.get(mod_id, "") if mod_id else "",
             )
 
+        flush_docs()
+
+    jobs.put(None)
+    worker.join()
+    if errors:
+        raise errors[0]
+
     print("\nIngest done.", flush=True)
 
 
@@ -0,0 +1,33 @@
+"""
+JSON helpers backed by orjson (Rust, 2-5x faster than stdlib) when installed,
+falling back to stdlib json otherwise. Import loads/dumps from here instead of
+json so every hot path picks up the fast parser without a hard dependency.
+"""
+from __future__ import annotations
+
+import json as _json
+from typing import Any
+
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+
+if _orjson is not None:
+
+    def loads(data: str | bytes) -> Any:
+        return _orjson.loads(data)
+
+    def dumps(obj: Any, indent: int | None = None) -> str:
+        # orjson only offers 2-space indentation; every caller here uses indent=2
+        option = _orjson.OPT_INDENT_2 if indent else 0
+        return _orjson.dumps(obj, option=option).decode()
+
+else:
+
+    def loads(data: str | bytes) -> Any:
+        return _json.loads(data)
+
+    def dumps(obj: Any, indent: int | None = None) -> str:
+        return _json.dumps(obj, indent=indent)
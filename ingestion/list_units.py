@@ -8,9 +8,9 @@ Usage:
 from __future__ import annotations
 
 import argparse
-import json
 import sys
 
+import jsonfast
 from snowflake_rag import get_course_name, list_conceptual_units, list_units
 
 
@@ -27,12 +27,12 @@ def main() -> None:
             course_name = get_course_name(args.course_id)
             if args.json:
                 out = {"courseId": args.course_id, "courseName": course_name or "", "units": units}
-                print(json.dumps(out, indent=2))
+                print(jsonfast.dumps(out, indent=2))
                 return
         else:
             units = list_units(args.course_id)
             if args.json:
-                print(json.dumps(units, indent=2))
+                print(jsonfast.dumps(units, indent=2))
                 return
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
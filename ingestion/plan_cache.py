@@ -0,0 +1,50 @@
+"""
+Persistent lesson-plan extraction cache: sqlite under ingestion/.cache, keyed by
+sha256(model|prompt_version|source_text). Identical syllabi/content samples skip
+the Gemini generation call entirely on reruns.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+from typing import Any
+
+from embedding_cache import CACHE_DIR
+
+_DB_PATH = CACHE_DIR / "plans.db"
+
+_conn: sqlite3.Connection | None = None
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        CACHE_DIR.mkdir(exist_ok=True)
+        _conn = sqlite3.connect(_DB_PATH, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS plan_cache ("
+            " key TEXT PRIMARY KEY,"
+            " plan TEXT NOT NULL,"
+            " created_at INT DEFAULT (strftime('%s','now')))"
+        )
+        _conn.commit()
+    return _conn
+
+
+def cache_key(model: str, prompt_version: str, source_text: str) -> str:
+    return hashlib.sha256(f"{model}|{prompt_version}|{source_text}".encode()).hexdigest()
+
+
+def get(key: str) -> dict[str, Any] | None:
+    row = _connect().execute("SELECT plan FROM plan_cache WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def put(key: str, plan: dict[str, Any]) -> None:
+    conn = _connect()
+    conn.execute(
+        "INSERT OR REPLACE INTO plan_cache (key, plan) VALUES (?, ?)",
+        (key, json.dumps(plan)),
+    )
+    conn.commit()
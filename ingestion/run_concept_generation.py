@@ -13,18 +13,31 @@ Usage:
 """
 from __future__ import annotations
 
-import argparse
-import json
+import gzip
+import os
 import sys
+from types import SimpleNamespace
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
-from build_lesson_plan import build_lesson_plan_for_course
-from snowflake_rag import get_chunks_for_course, get_course_name, list_conceptual_units
-from tag_chunks import tag_chunks_for_course
+import jsonfast
 
 REPO_ROOT = Path(__file__).resolve().parent.parent
 CLASSNAMES_JSON_PATH = REPO_ROOT / "public" / "classNames.json"
+# Per-course segments: each course's units land in their own file so a run
+# only rewrites data proportional to that course, not to every class merged
+# so far. The combined classNames.json above is still written for the
+# frontend, which reads the single file.
+CLASSNAMES_SEGMENT_DIR = REPO_ROOT / "public" / "classNames"
+
+
+def _write_json_atomic(path: Path, payload: dict) -> None:
+    """Write JSON via a temp file + os.replace so readers never see a torn file."""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(jsonfast.dumps(payload, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
 
 
 def _load_class_names_json() -> dict:
@@ -32,7 +45,8 @@ def _load_class_names_json() -> dict:
     if not CLASSNAMES_JSON_PATH.exists():
         return {"classes": [], "classNames": []}
     try:
-        data = json.loads(CLASSNAMES_JSON_PATH.read_text(encoding="utf-8"))
+        # Bytes straight into the parser; skips the intermediate str decode
+        data = jsonfast.loads(CLASSNAMES_JSON_PATH.read_bytes())
         if isinstance(data, dict) and "classes" in data:
             return data
         return {"classes": [], "classNames": []}
@@ -45,7 +59,9 @@ def _merge_course_into_class_names(
 ) -> dict:
     """Merge one course (courseId, className, units) into classNames.json structure. Returns full payload to write."""
     data = _load_class_names_json()
-    classes = list(data.get("classes") or [])
+    # Mutate the loaded list in place; the only caller writes the merged
+    # payload straight back out, so a defensive copy buys nothing
+    classes = data.get("classes")
     if not isinstance(classes, list):
         classes = []
     # Normalize: ensure each entry has className; match by courseId or className
@@ -55,25 +71,37 @@ def _merge_course_into_class_names(
         "courseId": course_id,
         "units": units,
     }
-    found = False
-    for i, c in enumerate(classes):    
+    # Index once by courseId and className; the merge is then two dict
+    # lookups instead of a linear scan per call. class_names is collected in
+    # the same pass and patched up after the merge, not rebuilt.
+    by_id: dict[str, int] = {}
+    by_name: dict[str, int] = {}
+    class_names: list[str] = []
+    name_pos: dict[int, int] = {}  # class index -> position in class_names
+    for i, c in enumerate(classes):
         if not isinstance(c, dict):
             continue
-        if c.get("courseId") == course_id:
-            classes[i] = {**c, **new_entry}
-            found = True
-            break
-        if (c.get("className") or "").strip() == display_name:
-            classes[i] = {**c, **new_entry}
-            found = True
-            break
-    if not found:
+        if c.get("courseId") and c["courseId"] not in by_id:
+            by_id[c["courseId"]] = i
+        name = (c.get("className") or "").strip()
+        if name:
+            name_pos[i] = len(class_names)
+            class_names.append(name)
+            if name not in by_name:
+                by_name[name] = i
+    idx = by_id.get(course_id)
+    if idx is None:
+        idx = by_name.get(display_name)
+    if idx is None:
         classes.append(new_entry)
-    class_names = []
-    for c in classes:
-        if isinstance(c, dict) and c.get("className"):
-            class_names.append((c.get("className") or "").strip())
-    class_names = [n for n in class_names if n]
+        class_names.append(display_name)
+    else:
+        classes[idx] = {**classes[idx], **new_entry}
+        pos = name_pos.get(idx)
+        if pos is None:
+            class_names.append(display_name)
+        else:
+            class_names[pos] = display_name
     return {
         "classes": classes,
         "classNames": class_names,
@@ -81,34 +109,161 @@ def _merge_course_into_class_names(
     }
 
 
-def main() -> None:
-    ap = argparse.ArgumentParser(
-        description="Build lesson plan from RAG content, tag chunks, then list conceptual units"
+def _write_json_gzip(path: Path, payload: dict) -> None:
+    """Write a gzip sidecar (<path>.gz) atomically; pretty JSON compresses ~10x."""
+    gz = path.with_suffix(path.suffix + ".gz")
+    tmp = gz.with_suffix(gz.suffix + ".tmp")
+    with gzip.open(tmp, "wb", compresslevel=6) as f:
+        f.write(jsonfast.dumps(payload, indent=2).encode("utf-8"))
+    os.replace(tmp, gz)
+
+
+def _class_names_unchanged(payload: dict) -> bool:
+    """True when the merged payload matches the on-disk file, ignoring updatedAt.
+
+    Re-running concept generation during development often produces the exact
+    same structure; comparing before writing makes those re-runs no-ops.
+    """
+    try:
+        existing = jsonfast.loads(CLASSNAMES_JSON_PATH.read_bytes())
+    except (OSError, ValueError):
+        return False
+    if not isinstance(existing, dict):
+        return False
+    return {k: v for k, v in existing.items() if k != "updatedAt"} == {
+        k: v for k, v in payload.items() if k != "updatedAt"
+    }
+
+
+def _write_course_segment(
+    course_id: str, course_name: str, units: list, updated_at: str, payload: dict
+) -> None:
+    """Write public/classNames/<courseId>.json plus a light index.json (names, courseIds)."""
+    CLASSNAMES_SEGMENT_DIR.mkdir(parents=True, exist_ok=True)
+    segment = {
+        "className": (course_name or "").strip() or course_id,
+        "courseId": course_id,
+        "units": units,
+        "updatedAt": updated_at,
+    }
+    _write_json_atomic(CLASSNAMES_SEGMENT_DIR / f"{course_id}.json", segment)
+    index = {
+        "classNames": payload.get("classNames") or [],
+        "courseIds": [
+            c.get("courseId")
+            for c in payload.get("classes") or []
+            if isinstance(c, dict) and c.get("courseId")
+        ],
+        "updatedAt": updated_at,
+    }
+    _write_json_atomic(CLASSNAMES_SEGMENT_DIR / "index.json", index)
+
+
+def _iter_structure_lines(units: list) -> Iterator[str]:
+    """Yield display lines for the unit/topic/subtopic tree, one at a time."""
+    for u in units:
+        yield f"  {u.get('unit_id', '?')}: {u.get('unit_name', '')} (chunks: {u.get('chunk_count', 0)})\n"
+        for t in u.get("topics") or []:
+            yield f"    Topic {t.get('topic_id', '?')}: {t.get('topic_name', '')} (chunks: {t.get('chunk_count', 0)})\n"
+            for s in t.get("subtopics") or []:
+                yield f"      Subtopic {s.get('subtopic_id', '?')}: {s.get('subtopic_name', '')} (chunks: {s.get('chunk_count', 0)})\n"
+
+
+def _parse_args(argv: list[str]) -> SimpleNamespace:
+    """
+    Hand-rolled parser for the handful of flags this CLI takes: argparse
+    setup costs tens of ms per invocation, which adds up when this script is
+    run in a shell loop over many courses. argparse is kept only for --help.
+    Accepts the same flags as before, in --flag value or --flag=value form.
+    """
+    if "-h" in argv or "--help" in argv:
+        import argparse
+
+        ap = argparse.ArgumentParser(
+            description="Build lesson plan from RAG content, tag chunks, then list conceptual units"
+        )
+        ap.add_argument("--course-id", type=str, required=True, help="Canvas course ID (must be already ingested)")
+        ap.add_argument("--course-name", type=str, default="", help="Course name (used when building plan from content)")
+        ap.add_argument("--batch-size", type=int, default=25, help="Chunks per LLM call for tagging (default 25)")
+        ap.add_argument("--max-concurrency", type=int, default=4, help="Tagging calls in flight at once (default 4)")
+        ap.add_argument("--use-batch-api", action="store_true", help="Submit tagging as a Gemini batch job (cheaper, slower)")
+        ap.add_argument("--force", action="store_true", help="Delete existing assignments and re-tag every chunk")
+        ap.add_argument("--no-compress", action="store_true", help="Skip writing the classNames.json.gz sidecar")
+        ap.add_argument("--json", action="store_true", help="Output final units as JSON only (no progress)")
+        ap.parse_args(argv)  # prints help and exits
+
+    args = SimpleNamespace(
+        course_id="", course_name="", batch_size=25, max_concurrency=4,
+        use_batch_api=False, force=False, no_compress=False, json=False,
     )
-    ap.add_argument("--course-id", type=str, required=True, help="Canvas course ID (must be already ingested)")
-    ap.add_argument("--course-name", type=str, default="", help="Course name (used when building plan from content)")
-    ap.add_argument("--batch-size", type=int, default=10, help="Chunks per LLM call for tagging (default 10)")
-    ap.add_argument("--json", action="store_true", help="Output final units as JSON only (no progress)")
-    args = ap.parse_args()
+    value_flags = {
+        "--course-id": ("course_id", str),
+        "--course-name": ("course_name", str),
+        "--batch-size": ("batch_size", int),
+        "--max-concurrency": ("max_concurrency", int),
+    }
+    bool_flags = {"--use-batch-api": "use_batch_api", "--force": "force", "--no-compress": "no_compress", "--json": "json"}
+    i = 0
+    while i < len(argv):
+        name, _, inline = argv[i].partition("=")
+        if name in bool_flags and not inline:
+            setattr(args, bool_flags[name], True)
+            i += 1
+            continue
+        if name in value_flags:
+            dest, conv = value_flags[name]
+            if not inline:
+                i += 1
+                if i >= len(argv):
+                    print(f"Error: {name} requires a value", file=sys.stderr)
+                    sys.exit(2)
+                inline = argv[i]
+            try:
+                setattr(args, dest, conv(inline))
+            except ValueError:
+                print(f"Error: invalid value for {name}: {inline}", file=sys.stderr)
+                sys.exit(2)
+            i += 1
+            continue
+        print(f"Error: unknown argument {argv[i]}", file=sys.stderr)
+        sys.exit(2)
+    return args
+
+
+def main() -> None:
+    args = _parse_args(sys.argv[1:])
 
     course_id = args.course_id.strip()
     if not course_id:
         print("Error: --course-id is required", file=sys.stderr)
         sys.exit(1)
 
-    # 1. Check we have chunks (existing RAG inputs)
-    chunks = get_chunks_for_course(course_id)
-    if not chunks:
-        print(
-            f"No chunks found for course {course_id}. Run ingest_course.py --course-id {course_id} first.",
-            file=sys.stderr,
-        )
-        sys.exit(1)
-    if not args.json:
-        print(f"Course {course_id}: {len(chunks)} chunks found. Building lesson plan...")
+    # Deferred until the arguments are valid: these pull in the Snowflake and
+    # LLM clients, which dominate cold start. --help and bad invocations
+    # never pay for them.
+    from build_lesson_plan import build_lesson_plan_for_course
+    from snowflake_rag import get_chunks_for_course, get_course_structure
+    from tag_chunks import tag_chunks_for_course
 
-    # 2. Build lesson plan (from syllabus or from sampled chunks)
-    plan_result = build_lesson_plan_for_course(course_id, args.course_name or course_id)
+    # 1+2. Chunk check and lesson-plan build are independent network calls;
+    # run them together so setup takes the longest of the two instead of
+    # their sum. (If the course has no chunks we exit after the plan job
+    # finishes; wasted work only on the error path.)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        chunks_future = pool.submit(get_chunks_for_course, course_id)
+        plan_future = pool.submit(
+            build_lesson_plan_for_course, course_id, args.course_name or course_id
+        )
+        chunks = chunks_future.result()
+        if not chunks:
+            print(
+                f"No chunks found for course {course_id}. Run ingest_course.py --course-id {course_id} first.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        if not args.json:
+            print(f"Course {course_id}: {len(chunks)} chunks found. Building lesson plan...")
+        plan_result = plan_future.result()
     units_plan = plan_result.get("units") or []
     if not units_plan:
         print("Failed to build a lesson plan (no units). Check syllabus or chunk content.", file=sys.stderr)
@@ -117,21 +272,30 @@ def main() -> None:
         print(f"  Plan built ({len(units_plan)} units, source: {plan_result.get('source', '?')}). Tagging chunks...")
 
     # 3. Tag chunks to unit/topic/subtopic
-    tag_result = tag_chunks_for_course(course_id, args.batch_size)
+    tag_result = tag_chunks_for_course(
+        course_id, args.batch_size, args.max_concurrency, args.use_batch_api,
+        force=args.force,
+    )
     if tag_result.get("error"):
         print(f"Tagging error: {tag_result['error']}", file=sys.stderr)
         sys.exit(1)
+    if tag_result.get("errors"):
+        # Partial failure: some batches exhausted their retries. Keep going
+        # with what was tagged rather than discarding the successful batches.
+        print(
+            f"Tagging warning: {len(tag_result['errors'])} batch(es) failed after retries.",
+            file=sys.stderr,
+        )
     if not args.json:
         print(f"  Tagged {tag_result.get('tagged', 0)} assignments in {tag_result.get('batches', 0)} batches.")
 
-    # 4. List conceptual units (with chunk counts)
-    units = list_conceptual_units(course_id)
-    course_name = get_course_name(course_id)
+    # 4. Course name + conceptual units (with chunk counts), fetched together
+    course_name, units = get_course_structure(course_id)
     payload = {
         "courseId": course_id,
         "courseName": course_name or "",
         "units": units,
-        "updatedAt": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "updatedAt": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
     }
 
     updated_at = payload["updatedAt"]
@@ -142,26 +306,32 @@ def main() -> None:
         class_names_payload = _merge_course_into_class_names(
             course_id, course_name or "", units, updated_at
         )
-        CLASSNAMES_JSON_PATH.write_text(
-            json.dumps(class_names_payload, indent=2), encoding="utf-8"
-        )
-        if not args.json:
-            print(f"\nWrote {CLASSNAMES_JSON_PATH} (classes: {len(class_names_payload['classes'])})")
+        if _class_names_unchanged(class_names_payload):
+            if not args.json:
+                print(f"\n{CLASSNAMES_JSON_PATH} unchanged; skipping write")
+        else:
+            _write_json_atomic(CLASSNAMES_JSON_PATH, class_names_payload)
+            if not args.no_compress:
+                # Sidecar for servers that can send Content-Encoding: gzip;
+                # the plain file stays for dev and current frontend reads
+                _write_json_gzip(CLASSNAMES_JSON_PATH, class_names_payload)
+            _write_course_segment(
+                course_id, course_name or "", units, updated_at, class_names_payload
+            )
+            if not args.json:
+                print(f"\nWrote {CLASSNAMES_JSON_PATH} (classes: {len(class_names_payload['classes'])})")
     except Exception as e:
         if not args.json:
             print(f"  (Could not write classNames.json: {e})", file=sys.stderr)
 
     if args.json:
-        print(json.dumps(payload, indent=2))
+        print(jsonfast.dumps(payload, indent=2))
         return
-    print(f"\nConceptual structure for course {course_name or course_id}:\n")
-    for u in units:
-        print(f"  {u.get('unit_id', '?')}: {u.get('unit_name', '')} (chunks: {u.get('chunk_count', 0)})")
-        for t in u.get("topics") or []:
-            print(f"    Topic {t.get('topic_id', '?')}: {t.get('topic_name', '')} (chunks: {t.get('chunk_count', 0)})")
-            for s in t.get("subtopics") or []:
-                print(f"      Subtopic {s.get('subtopic_id', '?')}: {s.get('subtopic_name', '')} (chunks: {s.get('chunk_count', 0)})")
-    print("\nDone. Use these unit_id / topic_id / subtopic_id with generate_questions.py --unit-id etc.")
+    # Stream the tree lines straight to stdout's buffer: no per-line print
+    # overhead and no materialized line list for deep hierarchies
+    sys.stdout.write(f"\nConceptual structure for course {course_name or course_id}:\n\n")
+    sys.stdout.writelines(_iter_structure_lines(units))
+    sys.stdout.write("\nDone. Use these unit_id / topic_id / subtopic_id with generate_questions.py --unit-id etc.\n")
 
 
 if __name__ == "__main__":
@@ -4,14 +4,24 @@ Uses REST API with token auth to match existing getCanvas.js setup.
 """
 from __future__ import annotations
 
-import json
+import os
 import time
 import uuid
-from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+try:  # optional: only needed when RETRIEVAL_LOCAL_CACHE is enabled
+    import numpy as np
+except ImportError:
+    np = None
+
+import jsonfast
 from config import (
+    RETRIEVAL_LOCAL_CACHE,
     SNOWFLAKE_DATABASE,
     SNOWFLAKE_HOST,
     SNOWFLAKE_RAG_SCHEMA,
@@ -24,15 +34,35 @@ from config import (
 ENDPOINT = f"https://{SNOWFLAKE_HOST}/api/v2/statements" if SNOWFLAKE_HOST else ""
 
 
-def _headers() -> dict[str, str]:
-    h = {
-        "Authorization": f"Bearer {SNOWFLAKE_TOKEN}",
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-    }
-    if SNOWFLAKE_TOKEN_TYPE:
-        h["X-Snowflake-Authorization-Token-Type"] = SNOWFLAKE_TOKEN_TYPE
-    return h
+# Headers are constant for the process lifetime (token and token type come
+# from config), so build them once and hand them to the session below
+_HEADERS = {
+    "Authorization": f"Bearer {SNOWFLAKE_TOKEN}",
+    "Accept": "application/json",
+    # Explicit, rather than relying on requests' default: result-bearing
+    # responses (chunk text, embeddings) compress 5-10x and urllib3
+    # decompresses transparently
+    "Accept-Encoding": "gzip, deflate",
+    "Content-Type": "application/json",
+}
+if SNOWFLAKE_TOKEN_TYPE:
+    _HEADERS["X-Snowflake-Authorization-Token-Type"] = SNOWFLAKE_TOKEN_TYPE
+
+
+# One pooled session for all statement traffic: urllib3 keep-alive reuses the
+# TLS connection to the Snowflake host instead of re-handshaking per call.
+# Retry covers transient 429/5xx on the idempotent status polls (POSTs are not
+# retried by default, so statements never run twice).
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+    ),
+)
+_SESSION.headers.update(_HEADERS)
 
 
 def _body(
@@ -58,30 +88,74 @@ def _body(
     return body
 
 
-def execute(
+def _call(
     statement: str,
     bindings: dict | None = None,
     timeout: int = 120,
     include_database: bool = True,
     include_schema: bool = True,
-) -> dict[str, Any]:
-    resp = requests.post(
+    fetch: bool = False,
+) -> Any:
+    """
+    Submit one statement over the pooled session. Returns the parsed response
+    payload; with fetch=True, polls an async statement handle if needed and
+    returns the result rows instead. All POST/parse/error handling and the
+    poll loop live here so execute and _execute_and_fetch cannot drift.
+    """
+    resp = _SESSION.post(
         ENDPOINT,
-        headers=_headers(),
         json=_body(statement, bindings, timeout, include_database, include_schema),
     )
-    raw = resp.text
+    if not resp.ok:
+        # resp.text (charset decode) only on the error path; the success path
+        # parses the raw bytes directly without materializing a str first
+        raise RuntimeError(f"Snowflake error ({resp.status_code}): {resp.text}")
     try:
-        data = json.loads(raw) if raw else {}
-    except json.JSONDecodeError:
+        data = jsonfast.loads(resp.content) if resp.content else {}
+    except ValueError:
         data = {}
-    if not resp.ok:
-        raise RuntimeError(f"Snowflake error ({resp.status_code}): {raw}")
-    return data
+    if not fetch:
+        return data
+
+    # Inline result
+    if data.get("data") is not None:
+        return data["data"]
+    handle = data.get("statementHandle")
+    if not handle:
+        return []
+
+    # Poll for result. Short queries often finish within tens of ms of the
+    # submit returning, so start polling quickly and back off geometrically
+    # to 500ms; a monotonic deadline keeps the old ~30s overall ceiling.
+    deadline = time.monotonic() + 30.0
+    delay = 0.025
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+        r2 = _SESSION.get(f"{ENDPOINT}/{handle}")
+        r2.raise_for_status()
+        d = jsonfast.loads(r2.content)
+        if d.get("status") == "SUCCESS" and "data" in d:
+            return d.get("data", [])
+        if d.get("status") in ("FAILED", "ABORTED"):
+            raise RuntimeError(d.get("message", str(d)))
+    return []
+
+
+def execute(
+    statement: str,
+    bindings: dict | None = None,
+    timeout: int = 120,
+    include_database: bool = True,
+    include_schema: bool = True,
+) -> dict[str, Any]:
+    return _call(statement, bindings, timeout, include_database, include_schema)
 
 
 def ensure_rag_schema() -> None:
     """Create database if needed, then RAG schema and RAG tables."""
+    # Database then schema must exist before any table DDL, so these two stay
+    # serial
     execute(
         "CREATE DATABASE IF NOT EXISTS " + SNOWFLAKE_DATABASE,
         timeout=60,
@@ -94,7 +168,10 @@ def ensure_rag_schema() -> None:
         include_schema=False,
     )
 
-    execute(
+    # The table creates are independent of each other; issuing them together
+    # over the pooled session makes schema bootstrap cost ~one round-trip
+    # instead of eight
+    table_ddls = [
         f"""
         CREATE TABLE IF NOT EXISTS {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.courses (
             course_id STRING PRIMARY KEY,
@@ -102,9 +179,6 @@ def ensure_rag_schema() -> None:
             created_at TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
         )
         """,
-        timeout=60,
-    )
-    execute(
         f"""
         CREATE TABLE IF NOT EXISTS {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.modules (
             module_id STRING PRIMARY KEY,
@@ -112,9 +186,7 @@ def ensure_rag_schema() -> None:
             module_name STRING,
             created_at TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
         )
-        """
-    )
-    execute(
+        """,
         f"""
         CREATE TABLE IF NOT EXISTS {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.documents (
             document_id STRING PRIMARY KEY,
@@ -126,9 +198,7 @@ def ensure_rag_schema() -> None:
             created_at TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
             updated_at TIMESTAMP_NTZ
         )
-        """
-    )
-    execute(
+        """,
         f"""
         CREATE TABLE IF NOT EXISTS {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks (
             chunk_id STRING PRIMARY KEY,
@@ -144,12 +214,8 @@ def ensure_rag_schema() -> None:
             course_name STRING,
             module_name STRING
         )
-        """
-    )
-    _add_chunk_traceability_columns_if_missing()
-
-    # Conceptual lesson plan: unit -> topic -> subtopic (for scoped generation)
-    execute(
+        """,
+        # Conceptual lesson plan: unit -> topic -> subtopic (for scoped generation)
         f"""
         CREATE TABLE IF NOT EXISTS {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.units (
             unit_id STRING PRIMARY KEY,
@@ -158,9 +224,7 @@ def ensure_rag_schema() -> None:
             sort_order INT DEFAULT 0,
             created_at TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
         )
-        """
-    )
-    execute(
+        """,
         f"""
         CREATE TABLE IF NOT EXISTS {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.topics (
             topic_id STRING PRIMARY KEY,
@@ -169,9 +233,7 @@ def ensure_rag_schema() -> None:
             sort_order INT DEFAULT 0,
             created_at TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
         )
-        """
-    )
-    execute(
+        """,
         f"""
         CREATE TABLE IF NOT EXISTS {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.subtopics (
             subtopic_id STRING PRIMARY KEY,
@@ -180,9 +242,7 @@ def ensure_rag_schema() -> None:
             sort_order INT DEFAULT 0,
             created_at TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
         )
-        """
-    )
-    execute(
+        """,
         f"""
         CREATE TABLE IF NOT EXISTS {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.chunk_assignments (
             chunk_id STRING,
@@ -192,20 +252,62 @@ def ensure_rag_schema() -> None:
             created_at TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
             PRIMARY KEY (chunk_id, unit_id, topic_id, subtopic_id)
         )
-        """
-    )
+        """,
+    ]
+    with ThreadPoolExecutor(max_workers=len(table_ddls)) as pool:
+        list(pool.map(lambda ddl: execute(ddl, timeout=60), table_ddls))
+
+    # Depends on document_chunks existing, so it runs after the pool drains
+    _add_chunk_traceability_columns_if_missing()
 
 
 def _add_chunk_traceability_columns_if_missing() -> None:
     """Add human-readable source columns to document_chunks if table existed from before."""
+    # One metadata call (SHOW needs no warehouse compute) instead of three
+    # speculative ALTERs caught on "already exists"; column_name is the third
+    # field of each SHOW COLUMNS row
+    rows = _execute_and_fetch(
+        f"SHOW COLUMNS IN TABLE {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks"
+    )
+    existing = {(row[2] or "").lower() for row in rows if len(row) > 2}
     for col in ("document_title", "course_name", "module_name"):
-        try:
+        if col not in existing:
             execute(
                 f"ALTER TABLE {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks ADD COLUMN {col} STRING"
             )
-        except RuntimeError as e:
-            if "already exists" not in str(e).lower():
-                raise
+
+
+# Tiny in-process TTL memo for hot course-scoped lookups: course name,
+# syllabus text, and the assembled lesson plan are each read several times for
+# the same course within one run. Short TTLs keep results fresh while the
+# write paths below also invalidate eagerly.
+_CACHE_MISS = object()
+_COURSE_CACHE: dict[tuple[str, str], tuple[float, Any]] = {}
+_COURSE_CACHE_TTL = {"course_name": 60.0, "syllabus": 60.0, "lesson_plan": 10.0}
+
+
+def _cache_get(kind: str, course_id: str) -> Any:
+    entry = _COURSE_CACHE.get((kind, course_id))
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    return _CACHE_MISS
+
+
+def _cache_put(kind: str, course_id: str, value: Any) -> Any:
+    _COURSE_CACHE[(kind, course_id)] = (time.monotonic() + _COURSE_CACHE_TTL[kind], value)
+    return value
+
+
+def invalidate_course_cache(course_id: str) -> None:
+    """Drop cached lookups for one course after a write touches its data."""
+    for key in [k for k in _COURSE_CACHE if k[1] == course_id]:
+        del _COURSE_CACHE[key]
+
+
+def _invalidate_lesson_plans() -> None:
+    """Drop all cached lesson plans (topic/subtopic writes are not keyed by course)."""
+    for key in [k for k in _COURSE_CACHE if k[0] == "lesson_plan"]:
+        del _COURSE_CACHE[key]
 
 
 def _bind(index: int, value: str | None) -> dict:
@@ -213,87 +315,203 @@ def _bind(index: int, value: str | None) -> dict:
     return {str(index): {"type": "TEXT", "value": v}}
 
 
+def _bind_positional(vals: tuple | list) -> dict:
+    """Positional TEXT bindings 1..n from a flat value sequence."""
+    return {
+        str(i): {"type": "TEXT", "value": "" if v is None else str(v)}
+        for i, v in enumerate(vals, 1)
+    }
+
+
+# SQL for the single-row write paths is constant per process, so the text is
+# interpolated once here instead of on every call in the ingestion loops
+_SQL_MERGE_COURSE = f"""
+    MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.courses t
+    USING (SELECT ? AS course_id, ? AS course_name) s ON t.course_id = s.course_id
+    WHEN MATCHED THEN UPDATE SET t.course_name = s.course_name
+    WHEN NOT MATCHED THEN INSERT (course_id, course_name) VALUES (s.course_id, s.course_name)
+    """
+
+_SQL_MERGE_MODULE = f"""
+    MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.modules t
+    USING (SELECT ? AS module_id, ? AS course_id, ? AS module_name) s ON t.module_id = s.module_id
+    WHEN MATCHED THEN UPDATE SET t.module_name = s.module_name, t.course_id = s.course_id
+    WHEN NOT MATCHED THEN INSERT (module_id, course_id, module_name) VALUES (s.module_id, s.course_id, s.module_name)
+    """
+
+_SQL_MERGE_UNIT = f"""
+    MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.units t
+    USING (SELECT ? AS unit_id, ? AS course_id, ? AS unit_name, ? AS sort_order) s ON t.unit_id = s.unit_id
+    WHEN MATCHED THEN UPDATE SET t.unit_name = s.unit_name, t.course_id = s.course_id, t.sort_order = s.sort_order
+    WHEN NOT MATCHED THEN INSERT (unit_id, course_id, unit_name, sort_order) VALUES (s.unit_id, s.course_id, s.unit_name, s.sort_order)
+    """
+
+_SQL_MERGE_TOPIC = f"""
+    MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.topics t
+    USING (SELECT ? AS topic_id, ? AS unit_id, ? AS topic_name, ? AS sort_order) s ON t.topic_id = s.topic_id
+    WHEN MATCHED THEN UPDATE SET t.topic_name = s.topic_name, t.unit_id = s.unit_id, t.sort_order = s.sort_order
+    WHEN NOT MATCHED THEN INSERT (topic_id, unit_id, topic_name, sort_order) VALUES (s.topic_id, s.unit_id, s.topic_name, s.sort_order)
+    """
+
+_SQL_MERGE_SUBTOPIC = f"""
+    MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.subtopics t
+    USING (SELECT ? AS subtopic_id, ? AS topic_id, ? AS subtopic_name, ? AS sort_order) s ON t.subtopic_id = s.subtopic_id
+    WHEN MATCHED THEN UPDATE SET t.subtopic_name = s.subtopic_name, t.topic_id = s.topic_id, t.sort_order = s.sort_order
+    WHEN NOT MATCHED THEN INSERT (subtopic_id, topic_id, subtopic_name, sort_order) VALUES (s.subtopic_id, s.topic_id, s.subtopic_name, s.sort_order)
+    """
+
+_SQL_MERGE_CHUNK_ASSIGNMENT = f"""
+    MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.chunk_assignments t
+    USING (SELECT ? AS chunk_id, ? AS unit_id, ? AS topic_id, ? AS subtopic_id) s
+    ON t.chunk_id = s.chunk_id AND t.unit_id = s.unit_id AND t.topic_id = s.topic_id AND t.subtopic_id = s.subtopic_id
+    WHEN NOT MATCHED THEN INSERT (chunk_id, unit_id, topic_id, subtopic_id) VALUES (s.chunk_id, s.unit_id, s.topic_id, s.subtopic_id)
+    """
+
+_SQL_MERGE_DOCUMENT = f"""
+    MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.documents t
+    USING (SELECT ? AS document_id, ? AS course_id, ? AS module_id, ? AS document_type, ? AS title, ? AS raw_text) s
+    ON t.document_id = s.document_id
+    WHEN MATCHED THEN UPDATE SET t.raw_text = s.raw_text, t.title = s.title, t.module_id = s.module_id
+    WHEN NOT MATCHED THEN INSERT (document_id, course_id, module_id, document_type, title, raw_text) VALUES (s.document_id, s.course_id, s.module_id, s.document_type, s.title, s.raw_text)
+    """
+
+_SQL_INSERT_CHUNK = f"""
+    INSERT INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks
+    (chunk_id, document_id, course_id, module_id, text, embedding, document_title, course_name, module_name)
+    SELECT ?, ?, ?, ?, ?, PARSE_JSON(?)::VECTOR(FLOAT, 768), ?, ?, ?
+    """
+
+
 def insert_course(course_id: str, course_name: str) -> None:
-    bind = {**_bind(1, course_id), **_bind(2, course_name)}
-    execute(
-        f"""
-        MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.courses t
-        USING (SELECT ? AS course_id, ? AS course_name) s ON t.course_id = s.course_id
-        WHEN MATCHED THEN UPDATE SET t.course_name = s.course_name
-        WHEN NOT MATCHED THEN INSERT (course_id, course_name) VALUES (s.course_id, s.course_name)
-        """,
-        bindings=bind,
-    )
+    execute(_SQL_MERGE_COURSE, bindings=_bind_positional((course_id, course_name)))
+    invalidate_course_cache(course_id)
 
 
 def insert_module(module_id: str, course_id: str, module_name: str) -> None:
-    bind = {**_bind(1, module_id), **_bind(2, course_id), **_bind(3, module_name)}
-    execute(
-        f"""
-        MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.modules t
-        USING (SELECT ? AS module_id, ? AS course_id, ? AS module_name) s ON t.module_id = s.module_id
-        WHEN MATCHED THEN UPDATE SET t.module_name = s.module_name, t.course_id = s.course_id
-        WHEN NOT MATCHED THEN INSERT (module_id, course_id, module_name) VALUES (s.module_id, s.course_id, s.module_name)
-        """,
-        bindings=bind,
-    )
+    execute(_SQL_MERGE_MODULE, bindings=_bind_positional((module_id, course_id, module_name)))
 
 
 def insert_unit(unit_id: str, course_id: str, unit_name: str, sort_order: int = 0) -> None:
-    bind = {**_bind(1, unit_id), **_bind(2, course_id), **_bind(3, unit_name), **_bind(4, str(sort_order))}
+    execute(_SQL_MERGE_UNIT, bindings=_bind_positional((unit_id, course_id, unit_name, sort_order)))
+    invalidate_course_cache(course_id)
+
+
+def insert_topic(topic_id: str, unit_id: str, topic_name: str, sort_order: int = 0) -> None:
+    execute(_SQL_MERGE_TOPIC, bindings=_bind_positional((topic_id, unit_id, topic_name, sort_order)))
+    _invalidate_lesson_plans()
+
+
+def insert_subtopic(subtopic_id: str, topic_id: str, subtopic_name: str, sort_order: int = 0) -> None:
+    execute(_SQL_MERGE_SUBTOPIC, bindings=_bind_positional((subtopic_id, topic_id, subtopic_name, sort_order)))
+    _invalidate_lesson_plans()
+
+
+def _values_bind(rows: list[tuple]) -> dict:
+    """Flatten row tuples into positional TEXT bindings for a multi-row VALUES clause."""
+    bind: dict[str, dict] = {}
+    i = 1
+    for row in rows:
+        for v in row:
+            bind[str(i)] = {"type": "TEXT", "value": "" if v is None else str(v)}
+            i += 1
+    return bind
+
+
+def insert_units_bulk(rows: list[tuple[str, str, str, int]]) -> None:
+    """Merge many (unit_id, course_id, unit_name, sort_order) rows in one statement."""
+    if not rows:
+        return
+    values = ", ".join(["(?, ?, ?, ?)"] * len(rows))
     execute(
         f"""
         MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.units t
-        USING (SELECT ? AS unit_id, ? AS course_id, ? AS unit_name, ? AS sort_order) s ON t.unit_id = s.unit_id
+        USING (SELECT column1 AS unit_id, column2 AS course_id, column3 AS unit_name, column4 AS sort_order
+               FROM VALUES {values}) s ON t.unit_id = s.unit_id
         WHEN MATCHED THEN UPDATE SET t.unit_name = s.unit_name, t.course_id = s.course_id, t.sort_order = s.sort_order
         WHEN NOT MATCHED THEN INSERT (unit_id, course_id, unit_name, sort_order) VALUES (s.unit_id, s.course_id, s.unit_name, s.sort_order)
         """,
-        bindings=bind,
+        bindings=_values_bind(rows),
     )
+    for cid in {row[1] for row in rows}:
+        invalidate_course_cache(cid)
 
 
-def insert_topic(topic_id: str, unit_id: str, topic_name: str, sort_order: int = 0) -> None:
-    bind = {**_bind(1, topic_id), **_bind(2, unit_id), **_bind(3, topic_name), **_bind(4, str(sort_order))}
+def insert_topics_bulk(rows: list[tuple[str, str, str, int]]) -> None:
+    """Merge many (topic_id, unit_id, topic_name, sort_order) rows in one statement."""
+    if not rows:
+        return
+    values = ", ".join(["(?, ?, ?, ?)"] * len(rows))
     execute(
         f"""
         MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.topics t
-        USING (SELECT ? AS topic_id, ? AS unit_id, ? AS topic_name, ? AS sort_order) s ON t.topic_id = s.topic_id
+        USING (SELECT column1 AS topic_id, column2 AS unit_id, column3 AS topic_name, column4 AS sort_order
+               FROM VALUES {values}) s ON t.topic_id = s.topic_id
         WHEN MATCHED THEN UPDATE SET t.topic_name = s.topic_name, t.unit_id = s.unit_id, t.sort_order = s.sort_order
         WHEN NOT MATCHED THEN INSERT (topic_id, unit_id, topic_name, sort_order) VALUES (s.topic_id, s.unit_id, s.topic_name, s.sort_order)
         """,
-        bindings=bind,
+        bindings=_values_bind(rows),
     )
+    _invalidate_lesson_plans()
 
 
-def insert_subtopic(subtopic_id: str, topic_id: str, subtopic_name: str, sort_order: int = 0) -> None:
-    bind = {**_bind(1, subtopic_id), **_bind(2, topic_id), **_bind(3, subtopic_name), **_bind(4, str(sort_order))}
+def insert_subtopics_bulk(rows: list[tuple[str, str, str, int]]) -> None:
+    """Merge many (subtopic_id, topic_id, subtopic_name, sort_order) rows in one statement."""
+    if not rows:
+        return
+    values = ", ".join(["(?, ?, ?, ?)"] * len(rows))
     execute(
         f"""
         MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.subtopics t
-        USING (SELECT ? AS subtopic_id, ? AS topic_id, ? AS subtopic_name, ? AS sort_order) s ON t.subtopic_id = s.subtopic_id
+        USING (SELECT column1 AS subtopic_id, column2 AS topic_id, column3 AS subtopic_name, column4 AS sort_order
+               FROM VALUES {values}) s ON t.subtopic_id = s.subtopic_id
         WHEN MATCHED THEN UPDATE SET t.subtopic_name = s.subtopic_name, t.topic_id = s.topic_id, t.sort_order = s.sort_order
         WHEN NOT MATCHED THEN INSERT (subtopic_id, topic_id, subtopic_name, sort_order) VALUES (s.subtopic_id, s.topic_id, s.subtopic_name, s.sort_order)
         """,
-        bindings=bind,
+        bindings=_values_bind(rows),
     )
+    _invalidate_lesson_plans()
 
 
 def upsert_chunk_assignment(chunk_id: str, unit_id: str, topic_id: str = "", subtopic_id: str = "") -> None:
     """Assign a chunk to a (unit, topic, subtopic). Use '' for topic_id/subtopic_id when not applicable."""
-    tid = topic_id or ""
-    sid = subtopic_id or ""
-    bind = {**_bind(1, chunk_id), **_bind(2, unit_id), **_bind(3, tid), **_bind(4, sid)}
+    execute(
+        _SQL_MERGE_CHUNK_ASSIGNMENT,
+        bindings=_bind_positional((chunk_id, unit_id, topic_id or "", subtopic_id or "")),
+    )
+
+
+def upsert_chunk_assignments_bulk(rows: list[tuple[str, str, str, str]]) -> None:
+    """
+    Merge many (chunk_id, unit_id, topic_id, subtopic_id) assignments in one
+    statement; one round-trip instead of one per assignment. DISTINCT guards
+    against duplicate source rows hitting the same target key.
+    """
+    if not rows:
+        return
+    values = ", ".join(["(?, ?, ?, ?)"] * len(rows))
     execute(
         f"""
         MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.chunk_assignments t
-        USING (SELECT ? AS chunk_id, ? AS unit_id, ? AS topic_id, ? AS subtopic_id) s
+        USING (SELECT DISTINCT column1 AS chunk_id, column2 AS unit_id, column3 AS topic_id, column4 AS subtopic_id
+               FROM VALUES {values}) s
         ON t.chunk_id = s.chunk_id AND t.unit_id = s.unit_id AND t.topic_id = s.topic_id AND t.subtopic_id = s.subtopic_id
         WHEN NOT MATCHED THEN INSERT (chunk_id, unit_id, topic_id, subtopic_id) VALUES (s.chunk_id, s.unit_id, s.topic_id, s.subtopic_id)
         """,
-        bindings=bind,
+        bindings=_values_bind(rows),
     )
 
 
+def get_tagged_chunk_ids(course_id: str) -> set[str]:
+    """Chunk ids that already have at least one assignment for this course."""
+    sql = f"""
+    SELECT DISTINCT a.chunk_id
+    FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.chunk_assignments a
+    INNER JOIN {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks c ON c.chunk_id = a.chunk_id
+    WHERE c.course_id = ?
+    """
+    return {row[0] for row in _execute_and_fetch(sql, _bind(1, course_id))}
+
+
 def delete_chunk_assignments_for_course(course_id: str) -> None:
     """Remove all chunk_assignments for chunks belonging to this course (so we can re-tag)."""
     bind = _bind(1, course_id)
@@ -314,24 +532,12 @@ def insert_document(
     title: str,
     raw_text: str,
 ) -> None:
-    bind = {
-        **_bind(1, document_id),
-        **_bind(2, course_id),
-        **_bind(3, module_id),
-        **_bind(4, document_type),
-        **_bind(5, title),
-        **_bind(6, raw_text),
-    }
     execute(
-        f"""
-        MERGE INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.documents t
-        USING (SELECT ? AS document_id, ? AS course_id, ? AS module_id, ? AS document_type, ? AS title, ? AS raw_text) s
-        ON t.document_id = s.document_id
-        WHEN MATCHED THEN UPDATE SET t.raw_text = s.raw_text, t.title = s.title, t.module_id = s.module_id
-        WHEN NOT MATCHED THEN INSERT (document_id, course_id, module_id, document_type, title, raw_text) VALUES (s.document_id, s.course_id, s.module_id, s.document_type, s.title, s.raw_text)
-        """,
-        bindings=bind,
+        _SQL_MERGE_DOCUMENT,
+        bindings=_bind_positional((document_id, course_id, module_id, document_type, title, raw_text)),
     )
+    if document_type == "syllabus":
+        invalidate_course_cache(course_id)
 
 
 def delete_chunks_by_document_id(document_id: str) -> None:
@@ -343,6 +549,16 @@ def delete_chunks_by_document_id(document_id: str) -> None:
         """,
         bindings=bind,
     )
+    _invalidate_embedding_cache()
+
+
+def _embedding_json(embedding: list[float]) -> str:
+    """
+    Serialize an embedding as a JSON array at float32 precision. Gemini returns
+    full double-precision floats; 7 significant digits is all a float32 carries
+    and roughly halves the statement payload per vector.
+    """
+    return jsonfast.dumps([round(x, 7) for x in embedding])
 
 
 def insert_chunk(
@@ -357,34 +573,88 @@ def insert_chunk(
     module_name: str = "",
 ) -> None:
     # Snowflake: pass vector as JSON array string; PARSE_JSON gives VARIANT, cast to VECTOR
-    emb_str = json.dumps(embedding)
-    bind = {
-        "1": {"type": "TEXT", "value": chunk_id},
-        "2": {"type": "TEXT", "value": document_id},
-        "3": {"type": "TEXT", "value": course_id},
-        "4": {"type": "TEXT", "value": module_id},
-        "5": {"type": "TEXT", "value": text},
-        "6": {"type": "TEXT", "value": emb_str},
-        "7": {"type": "TEXT", "value": (document_title or "")[:65535]},
-        "8": {"type": "TEXT", "value": (course_name or "")[:65535]},
-        "9": {"type": "TEXT", "value": (module_name or "")[:65535]},
-    }
+    execute(
+        _SQL_INSERT_CHUNK,
+        bindings=_bind_positional(
+            (
+                chunk_id,
+                document_id,
+                course_id,
+                module_id,
+                text,
+                _embedding_json(embedding),
+                (document_title or "")[:65535],
+                (course_name or "")[:65535],
+                (module_name or "")[:65535],
+            )
+        ),
+    )
+    _invalidate_embedding_cache()
+
+
+# Rows per INSERT statement: 500 chunks x 9 columns keeps the binding count
+# and statement size comfortably inside REST API limits
+INSERT_CHUNKS_MAX_ROWS = 500
+
+
+def insert_chunks_batch(rows: list[dict]) -> None:
+    """
+    Insert many chunk rows in one statement (one round-trip and one compile
+    instead of one per chunk), splitting into slices of INSERT_CHUNKS_MAX_ROWS
+    for very large batches. Each row is a dict with insert_chunk's argument
+    names; vectors ride along as JSON text and are cast server-side, same as
+    the single-row path.
+    """
+    if not rows:
+        return
+    if len(rows) > INSERT_CHUNKS_MAX_ROWS:
+        for i in range(0, len(rows), INSERT_CHUNKS_MAX_ROWS):
+            insert_chunks_batch(rows[i : i + INSERT_CHUNKS_MAX_ROWS])
+        return
+    tuples = [
+        (
+            r["chunk_id"],
+            r["document_id"],
+            r["course_id"],
+            r["module_id"],
+            r["text"],
+            _embedding_json(r["embedding"]),
+            (r.get("document_title") or "")[:65535],
+            (r.get("course_name") or "")[:65535],
+            (r.get("module_name") or "")[:65535],
+        )
+        for r in rows
+    ]
+    values = ", ".join(["(?, ?, ?, ?, ?, ?, ?, ?, ?)"] * len(tuples))
     execute(
         f"""
         INSERT INTO {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks
         (chunk_id, document_id, course_id, module_id, text, embedding, document_title, course_name, module_name)
-        SELECT ?, ?, ?, ?, ?, PARSE_JSON(?)::VECTOR(FLOAT, 768), ?, ?, ?
+        SELECT column1, column2, column3, column4, column5, PARSE_JSON(column6)::VECTOR(FLOAT, 768), column7, column8, column9
+        FROM VALUES {values}
         """,
-        bindings=bind,
+        bindings=_values_bind(tuples),
     )
+    _invalidate_embedding_cache()
 
 
 def generate_chunk_id() -> str:
     return str(uuid.uuid4())
 
 
+def generate_chunk_ids(n: int) -> list[str]:
+    """n UUID4 strings from one urandom draw instead of one syscall per id."""
+    b = os.urandom(16 * n)
+    return [
+        str(uuid.UUID(bytes=b[i * 16 : (i + 1) * 16], version=4)) for i in range(n)
+    ]
+
+
 def get_course_name(course_id: str) -> str:
     """Return course_name from RAG courses table for display; empty string if not found."""
+    cached = _cache_get("course_name", course_id)
+    if cached is not _CACHE_MISS:
+        return cached
     bind = _bind(1, course_id)
     sql = f"""
     SELECT COALESCE(course_name, '') FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.courses
@@ -393,12 +663,15 @@ def get_course_name(course_id: str) -> str:
     """
     data = _execute_and_fetch(sql, bind)
     if not data or not data[0]:
-        return ""
-    return (data[0][0] or "").strip()
+        return _cache_put("course_name", course_id, "")
+    return _cache_put("course_name", course_id, (data[0][0] or "").strip())
 
 
 def get_syllabus_text(course_id: str) -> str | None:
     """Return raw_text of the syllabus document for the course, if any."""
+    cached = _cache_get("syllabus", course_id)
+    if cached is not _CACHE_MISS:
+        return cached
     bind = _bind(1, course_id)
     sql = f"""
     SELECT raw_text FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.documents
@@ -407,74 +680,98 @@ def get_syllabus_text(course_id: str) -> str | None:
     """
     data = _execute_and_fetch(sql, bind)
     if not data or not data[0]:
-        return None
-    return (data[0][0] or "").strip() or None
+        return _cache_put("syllabus", course_id, None)
+    return _cache_put("syllabus", course_id, (data[0][0] or "").strip() or None)
 
 
-def get_chunks_for_course(course_id: str) -> list[dict[str, Any]]:
-    """Return all chunks for a course (chunk_id, text, document_title) for tagging."""
-    bind = _bind(1, course_id)
-    sql = f"""
-    SELECT chunk_id, text, COALESCE(document_title, '') AS document_title
-    FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks
-    WHERE course_id = ?
-    ORDER BY chunk_id
+# Rows per page when iterating a course's chunks; full texts ride along, so
+# pages are kept modest to bound response sizes
+CHUNK_PAGE_SIZE = 500
+
+
+def iter_chunks_for_course(course_id: str, batch: int = CHUNK_PAGE_SIZE) -> Iterator[dict[str, Any]]:
+    """
+    Yield chunks (chunk_id, text, document_title) for a course in keyset-
+    paginated pages, so large courses never arrive as one giant response and
+    callers can release each page as they go.
     """
-    data = _execute_and_fetch(sql, bind)
     columns = ["chunk_id", "text", "document_title"]
-    return [_row_to_dict(columns, row) for row in data]
+    last = ""
+    while True:
+        bind = {**_bind(1, course_id), **_bind(2, last)}
+        sql = f"""
+        SELECT chunk_id, text, COALESCE(document_title, '') AS document_title
+        FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks
+        WHERE course_id = ? AND chunk_id > ?
+        ORDER BY chunk_id
+        LIMIT {int(batch)}
+        """
+        data = _execute_and_fetch(sql, bind)
+        for row in data:
+            yield _row_to_dict(columns, row)
+        if len(data) < batch:
+            return
+        last = data[-1][0]
+
+
+def get_chunks_for_course(course_id: str) -> list[dict[str, Any]]:
+    """Return all chunks for a course (chunk_id, text, document_title) for tagging."""
+    return list(iter_chunks_for_course(course_id))
 
 
 def get_lesson_plan(course_id: str) -> dict[str, Any]:
-    """Return units with nested topics and subtopics for the course. Uses 3 batched queries."""
+    """Return units with nested topics and subtopics for the course.
+
+    One statement: the server assembles the whole hierarchy with nested
+    ARRAY_AGG(OBJECT_CONSTRUCT(...)) and returns it as a single JSON value,
+    replacing the previous three sequential queries plus Python stitching.
+    """
+    cached = _cache_get("lesson_plan", course_id)
+    if cached is not _CACHE_MISS:
+        return cached
     bind = _bind(1, course_id)
-    # 1. All units for the course
-    units_sql = f"""
-    SELECT unit_id, unit_name, sort_order FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.units
-    WHERE course_id = ? ORDER BY sort_order, unit_id
-    """
-    units_data = _execute_and_fetch(units_sql, bind)
-    if not units_data:
-        return {"units": []}
-    # 2. All topics for this course (join units to filter by course_id)
-    topics_sql = f"""
-    SELECT t.unit_id, t.topic_id, t.topic_name, t.sort_order
-    FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.topics t
-    INNER JOIN {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.units u ON u.unit_id = t.unit_id
-    WHERE u.course_id = ? ORDER BY u.sort_order, u.unit_id, t.sort_order, t.topic_id
-    """
-    topics_data = _execute_and_fetch(topics_sql, bind)
-    # 3. All subtopics for this course (join topics -> units to filter by course_id)
-    subtopics_sql = f"""
-    SELECT t.topic_id, s.subtopic_id, s.subtopic_name, s.sort_order
-    FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.subtopics s
-    INNER JOIN {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.topics t ON t.topic_id = s.topic_id
-    INNER JOIN {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.units u ON u.unit_id = t.unit_id
-    WHERE u.course_id = ? ORDER BY t.sort_order, t.topic_id, s.sort_order, s.subtopic_id
-    """
-    subtopics_data = _execute_and_fetch(subtopics_sql, bind)
-    # Index topics by unit_id, subtopics by topic_id
-    topics_by_unit: dict[str, list[dict[str, Any]]] = {}
-    for row in topics_data:
-        uid, tid, tname, torder = row[0], row[1], row[2] or "", row[3] or 0
-        if uid not in topics_by_unit:
-            topics_by_unit[uid] = []
-        topics_by_unit[uid].append({"topic_id": tid, "topic_name": tname, "sort_order": torder, "subtopics": []})
-    subtopics_by_topic: dict[str, list[dict[str, Any]]] = {}
-    for row in subtopics_data:
-        tid, sid, sname, sorder = row[0], row[1], row[2] or "", row[3] or 0
-        if tid not in subtopics_by_topic:
-            subtopics_by_topic[tid] = []
-        subtopics_by_topic[tid].append({"subtopic_id": sid, "subtopic_name": (sname or "").strip(), "sort_order": sorder})
-    # Build nested plan
-    plan = {"units": []}
-    for row in units_data:
-        uid, uname, order = row[0], row[1] or "", row[2] or 0
-        topics = topics_by_unit.get(uid, [])
-        for topic in topics:
-            topic["subtopics"] = subtopics_by_topic.get(topic["topic_id"], [])
-        plan["units"].append({"unit_id": uid, "unit_name": uname, "sort_order": order, "topics": topics})
-    return plan
+    prefix = f"{SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}"
+    # Bottom-up aggregation in derived tables (subtopics into topics, topics
+    # into units) rather than correlated SELECT-list subqueries: Snowflake's
+    # decorrelation rejects nested correlated subqueries with "Unsupported
+    # subquery type", while plain LEFT JOIN + GROUP BY always plans
+    sql = f"""
+    SELECT ARRAY_AGG(OBJECT_CONSTRUCT(
+        'unit_id', u.unit_id,
+        'unit_name', COALESCE(u.unit_name, ''),
+        'sort_order', COALESCE(u.sort_order, 0),
+        'topics', COALESCE(tp.topics, ARRAY_CONSTRUCT())
+    )) WITHIN GROUP (ORDER BY u.sort_order, u.unit_id)
+    FROM {prefix}.units u
+    LEFT JOIN (
+        SELECT t.unit_id,
+               ARRAY_AGG(OBJECT_CONSTRUCT(
+                   'topic_id', t.topic_id,
+                   'topic_name', COALESCE(t.topic_name, ''),
+                   'sort_order', COALESCE(t.sort_order, 0),
+                   'subtopics', COALESCE(st.subtopics, ARRAY_CONSTRUCT())
+               )) WITHIN GROUP (ORDER BY t.sort_order, t.topic_id) AS topics
+        FROM {prefix}.topics t
+        LEFT JOIN (
+            SELECT s.topic_id,
+                   ARRAY_AGG(OBJECT_CONSTRUCT(
+                       'subtopic_id', s.subtopic_id,
+                       'subtopic_name', TRIM(COALESCE(s.subtopic_name, '')),
+                       'sort_order', COALESCE(s.sort_order, 0)
+                   )) WITHIN GROUP (ORDER BY s.sort_order, s.subtopic_id) AS subtopics
+            FROM {prefix}.subtopics s
+            GROUP BY s.topic_id
+        ) st ON st.topic_id = t.topic_id
+        GROUP BY t.unit_id
+    ) tp ON tp.unit_id = u.unit_id
+    WHERE u.course_id = ?
+    """
+    data = _execute_and_fetch(sql, bind)
+    raw = data[0][0] if data and data[0] else None
+    if not raw:
+        return _cache_put("lesson_plan", course_id, {"units": []})
+    units = jsonfast.loads(raw) if isinstance(raw, str) else raw
+    return _cache_put("lesson_plan", course_id, {"units": units or []})
 
 
 def list_conceptual_units(course_id: str) -> list[dict[str, Any]]:
@@ -487,47 +784,73 @@ def list_conceptual_units(course_id: str) -> list[dict[str, Any]]:
     if not units_plan:
         return []
 
-    # Count assignments per (unit_id, topic_id, subtopic_id)
+    # Count assignments per (unit_id, topic_id, subtopic_id). ROLLUP makes
+    # the warehouse return unit- and topic-level totals in the same scan, so
+    # the client never re-sums the leaf counts (which was O(leaves) per unit).
+    # GROUPING() flags distinguish rolled-up rows from real '' topic ids.
     bind = _bind(1, course_id)
     sql = f"""
-    SELECT a.unit_id, COALESCE(a.topic_id, '') AS topic_id, COALESCE(a.subtopic_id, '') AS subtopic_id, COUNT(*) AS cnt
+    SELECT a.unit_id, COALESCE(a.topic_id, '') AS topic_id, COALESCE(a.subtopic_id, '') AS subtopic_id, COUNT(*) AS cnt,
+           GROUPING(a.unit_id) AS g_unit, GROUPING(a.topic_id) AS g_topic, GROUPING(a.subtopic_id) AS g_subtopic
     FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.chunk_assignments a
     INNER JOIN {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks c ON c.chunk_id = a.chunk_id
     WHERE c.course_id = ?
-    GROUP BY a.unit_id, a.topic_id, a.subtopic_id
+    GROUP BY ROLLUP(a.unit_id, a.topic_id, a.subtopic_id)
     """
     rows = _execute_and_fetch(sql, bind)
-    count_map: dict[tuple[str, str, str], int] = {}
+    unit_counts: dict[str, int] = {}
+    topic_counts: dict[tuple[str, str], int] = {}
+    sub_counts: dict[tuple[str, str, str], int] = {}
     for row in rows:
         try:
             cnt = int(row[3]) if len(row) > 3 and row[3] is not None else 0
         except (TypeError, ValueError):
             cnt = 0
-        count_map[(row[0], row[1], row[2])] = cnt
+        g_unit, g_topic, g_sub = int(row[4] or 0), int(row[5] or 0), int(row[6] or 0)
+        if g_unit:
+            continue  # grand total row
+        if g_topic:
+            unit_counts[row[0]] = cnt
+        elif g_sub:
+            topic_counts[(row[0], row[1])] = cnt
+        else:
+            sub_counts[(row[0], row[1], row[2])] = cnt
 
     result: list[dict[str, Any]] = []
     for u in units_plan:
         uid = u.get("unit_id") or ""
         uname = u.get("unit_name") or ""
-        unit_chunks = sum(v for (uid_k, _t, _s), v in count_map.items() if uid_k == uid)
+        unit_chunks = unit_counts.get(uid, 0)
         topics_out: list[dict[str, Any]] = []
         for t in u.get("topics") or []:
             tid = t.get("topic_id") or ""
             tname = t.get("topic_name") or ""
-            topic_chunks = sum(v for (uid_k, tid_k, _s), v in count_map.items() if uid_k == uid and tid_k == tid)
+            topic_chunks = topic_counts.get((uid, tid), 0)
             subtopics_out = []
             for s in t.get("subtopics") or []:
                 if not isinstance(s, dict):
                     continue
                 sid = s.get("subtopic_id") or ""
                 sname = s.get("subtopic_name") or ""
-                sub_chunks = count_map.get((uid, tid, sid), 0)
+                sub_chunks = sub_counts.get((uid, tid, sid), 0)
                 subtopics_out.append({"subtopic_id": sid, "subtopic_name": sname, "chunk_count": sub_chunks})
             topics_out.append({"topic_id": tid, "topic_name": tname, "chunk_count": topic_chunks, "subtopics": subtopics_out})
         result.append({"unit_id": uid, "unit_name": uname, "chunk_count": unit_chunks, "topics": topics_out})
     return result
 
 
+def get_course_structure(course_id: str) -> tuple[str, list[dict[str, Any]]]:
+    """
+    Return (course_name, conceptual units) for a course. The two lookups are
+    independent, so they run concurrently: one wall-clock round-trip instead
+    of two sequential ones for callers that need both.
+    """
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        name_future = pool.submit(get_course_name, course_id)
+        units_future = pool.submit(list_conceptual_units, course_id)
+        return name_future.result(), units_future.result()
+
+
 def list_units(course_id: str) -> list[dict[str, Any]]:
     """
     Return the course's units (modules) with human-readable names and document/chunk counts.
@@ -552,6 +875,119 @@ def list_units(course_id: str) -> list[dict[str, Any]]:
     return [_row_to_dict(columns, row) for row in data]
 
 
+# Opt-in local scoring (RETRIEVAL_LOCAL_CACHE=1, needs numpy): per-course
+# embedding matrices held in process so ranking is one matvec instead of a
+# warehouse scan. Vectors are stored int8-quantized (per-vector absmax scale):
+# the N x 768 scan is memory-bound, so a quarter of the float32 bytes means a
+# quarter of the bandwidth per query, and the rank order survives because
+# scores are rescaled by the saved scales after the integer dot products.
+_EMB_CACHE: dict[str, tuple[list[str], Any, Any]] = {}
+
+
+def _invalidate_embedding_cache() -> None:
+    _EMB_CACHE.clear()
+
+
+def _quantize_embeddings(emb: Any) -> tuple[Any, Any]:
+    """Quantize a float32 [N, 768] matrix to (int8 matrix, per-row scales)."""
+    scales = np.max(np.abs(emb), axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    emb_q = np.round(emb / scales[:, None]).astype(np.int8)
+    return emb_q, scales.astype(np.float32)
+
+
+def _load_course_embeddings(course_id: str) -> tuple[list[str], Any, Any]:
+    """Load (chunk_ids, int8 [N, 768] matrix, per-row scales) for a course, cached."""
+    cached = _EMB_CACHE.get(course_id)
+    if cached is not None:
+        return cached
+    ids: list[str] = []
+    vectors: list[list[float]] = []
+    last = ""
+    while True:
+        sql = f"""
+        SELECT chunk_id, embedding::ARRAY
+        FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks
+        WHERE course_id = ? AND chunk_id > ?
+        ORDER BY chunk_id
+        LIMIT {CHUNK_PAGE_SIZE}
+        """
+        data = _execute_and_fetch(sql, {**_bind(1, course_id), **_bind(2, last)})
+        for row in data:
+            ids.append(row[0])
+            raw = row[1]
+            vectors.append(jsonfast.loads(raw) if isinstance(raw, str) else raw)
+        if len(data) < CHUNK_PAGE_SIZE:
+            break
+        last = data[-1][0]
+    if not ids:
+        entry = (ids, None, None)
+    else:
+        emb = np.asarray(vectors, dtype=np.float32)
+        # Embeddings are unit length at ingest; normalizing here also covers
+        # rows written before normalization landed
+        norms = np.linalg.norm(emb, axis=1, keepdims=True)
+        np.divide(emb, norms, out=emb, where=norms > 0)
+        entry = (ids, *_quantize_embeddings(emb))
+    _EMB_CACHE[course_id] = entry
+    return entry
+
+
+def _fetch_chunks_by_ids(chunk_ids: list[str]) -> dict[str, dict[str, Any]]:
+    """Fetch display rows for the given chunk ids, keyed by chunk_id."""
+    placeholders = ", ".join(["?"] * len(chunk_ids))
+    sql = f"""
+    SELECT chunk_id, document_id, course_id, module_id, text,
+           COALESCE(document_title, '') AS document_title,
+           COALESCE(course_name, '') AS course_name,
+           COALESCE(module_name, '') AS module_name
+    FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks
+    WHERE chunk_id IN ({placeholders})
+    """
+    columns = ["chunk_id", "document_id", "course_id", "module_id", "text", "document_title", "course_name", "module_name"]
+    data = _execute_and_fetch(sql, _bind_positional(chunk_ids))
+    return {row[0]: _row_to_dict(columns, row) for row in data}
+
+
+def _retrieve_chunks_local(
+    course_id: str,
+    query_embedding: list[float],
+    top_k: int,
+    similarity_threshold: float,
+) -> list[dict[str, Any]]:
+    """Rank against the in-process embedding cache, then fetch only the winners.
+
+    Replaces the warehouse VECTOR_INNER_PRODUCT scan with a local matvec:
+    after the first call per course, a query costs one small SELECT for the
+    top-k texts instead of shipping every score through the warehouse.
+    """
+    ids, emb_q, scales = _load_course_embeddings(course_id)
+    if emb_q is None:
+        return []
+    q = np.asarray(query_embedding, dtype=np.float32)
+    qn = np.linalg.norm(q)
+    if qn > 0:
+        q /= qn
+    # Quantize the query the same way as the cache, dot in integers, then
+    # rescale; int32 accumulation because 768 * 127^2 overflows int16
+    q_scale = np.max(np.abs(q)) / 127.0 or 1.0
+    q_q = np.round(q / q_scale).astype(np.int32)
+    scores = (emb_q.astype(np.int32) @ q_q) * (scales * np.float32(q_scale))
+    k = min(int(top_k), len(ids))
+    top = np.argpartition(scores, -k)[-k:]
+    top = top[np.argsort(scores[top])[::-1]]
+    picked = [(ids[i], float(scores[i])) for i in top if scores[i] >= similarity_threshold]
+    if not picked:
+        return []
+    rows_by_id = _fetch_chunks_by_ids([cid for cid, _ in picked])
+    out = []
+    for cid, score in picked:
+        row = rows_by_id.get(cid)
+        if row:
+            out.append({**row, "score": score})
+    return out
+
+
 def retrieve_chunks(
     course_id: str,
     query_embedding: list[float],
@@ -566,57 +1002,80 @@ def retrieve_chunks(
     Optionally restrict to chunks that have an assignment for (unit_id, topic_id, subtopic_id).
     Use '' for any scope to leave it unconstrained. Requires at least 2 chunks above threshold
     for useful RAG; caller can check len >= 2.
+
+    Embeddings are unit-length at ingest, so scoring uses VECTOR_INNER_PRODUCT
+    (identical to cosine for normalized vectors, without per-row norms).
+    Courses ingested before normalization need a re-ingest for exact scores.
+
+    With RETRIEVAL_LOCAL_CACHE enabled (and numpy installed), unscoped queries
+    rank against the in-process embedding cache instead; scoped queries still
+    go to the warehouse, which owns the assignment join.
     """
-    emb_str = json.dumps(query_embedding)
+    emb_str = _embedding_json(query_embedding)
     uid = unit_id or ""
     tid = topic_id or ""
     sid = subtopic_id or ""
     scoped = bool(uid or tid or sid)
 
+    if RETRIEVAL_LOCAL_CACHE and np is not None and not scoped:
+        return _retrieve_chunks_local(course_id, query_embedding, top_k, similarity_threshold)
+
+    # threshold and top_k ride as binds, not literals, so the statement text
+    # is identical across calls and Snowflake can reuse the compiled plan
     if not scoped:
-        bind = {"1": {"type": "TEXT", "value": emb_str}, "2": {"type": "TEXT", "value": course_id}}
+        bind = {
+            "1": {"type": "TEXT", "value": emb_str},
+            "2": {"type": "TEXT", "value": course_id},
+            "3": {"type": "REAL", "value": str(similarity_threshold)},
+            "4": {"type": "FIXED", "value": str(int(top_k))},
+        }
         sql = f"""
         SELECT * FROM (
             SELECT chunk_id, document_id, course_id, module_id, text,
                    COALESCE(document_title, '') AS document_title,
                    COALESCE(course_name, '') AS course_name,
                    COALESCE(module_name, '') AS module_name,
-                   VECTOR_COSINE_SIMILARITY(embedding, PARSE_JSON(?)::VECTOR(FLOAT, 768)) AS score
+                   VECTOR_INNER_PRODUCT(embedding, PARSE_JSON(?)::VECTOR(FLOAT, 768)) AS score
             FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks
             WHERE course_id = ?
-        ) WHERE score >= {similarity_threshold}
+        ) WHERE score >= ?
         ORDER BY score DESC
-        LIMIT {top_k}
+        LIMIT ?
         """
     else:
+        # Only the scope predicates actually in use make it into the SQL:
+        # plain equality filters inside an EXISTS prune far better than the
+        # previous (? = '' OR a.col = ?) pattern, and with at most three
+        # scopes there are only a handful of statement-text variants to cache
         bind = {
             "1": {"type": "TEXT", "value": emb_str},
             "2": {"type": "TEXT", "value": course_id},
-            "3": {"type": "TEXT", "value": uid},
-            "4": {"type": "TEXT", "value": uid},
-            "5": {"type": "TEXT", "value": tid},
-            "6": {"type": "TEXT", "value": tid},
-            "7": {"type": "TEXT", "value": sid},
-            "8": {"type": "TEXT", "value": sid},
         }
+        clauses = ["a.chunk_id = d.chunk_id"]
+        idx = 3
+        for col, val in (("unit_id", uid), ("topic_id", tid), ("subtopic_id", sid)):
+            if val:
+                clauses.append(f"a.{col} = ?")
+                bind[str(idx)] = {"type": "TEXT", "value": val}
+                idx += 1
+        bind[str(idx)] = {"type": "REAL", "value": str(similarity_threshold)}
+        bind[str(idx + 1)] = {"type": "FIXED", "value": str(int(top_k))}
         sql = f"""
         SELECT * FROM (
             SELECT d.chunk_id, d.document_id, d.course_id, d.module_id, d.text,
                    COALESCE(d.document_title, '') AS document_title,
                    COALESCE(d.course_name, '') AS course_name,
                    COALESCE(d.module_name, '') AS module_name,
-                   VECTOR_COSINE_SIMILARITY(d.embedding, PARSE_JSON(?)::VECTOR(FLOAT, 768)) AS score
+                   VECTOR_INNER_PRODUCT(d.embedding, PARSE_JSON(?)::VECTOR(FLOAT, 768)) AS score
             FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.document_chunks d
             WHERE d.course_id = ?
-              AND d.chunk_id IN (
-                SELECT a.chunk_id FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.chunk_assignments a
-                WHERE (? = '' OR a.unit_id = ?)
-                  AND (? = '' OR a.topic_id = ?)
-                  AND (? = '' OR a.subtopic_id = ?)
+              AND EXISTS (
+                SELECT 1 FROM {SNOWFLAKE_DATABASE}.{SNOWFLAKE_RAG_SCHEMA}.chunk_assignments a
+                WHERE {" AND ".join(clauses)}
               )
-        ) WHERE score >= {similarity_threshold}
+        ) WHERE score >= ?
         ORDER BY score DESC
-        LIMIT {top_k}
+        LIMIT ?
         """
     data = _execute_and_fetch(sql, bind)
     columns = ["chunk_id", "document_id", "course_id", "module_id", "text", "document_title", "course_name", "module_name", "score"]
@@ -629,34 +1088,4 @@ def _row_to_dict(columns: list[str], row: list[Any]) -> dict[str, Any]:
 
 def _execute_and_fetch(statement: str, bindings: dict | None = None) -> list[list[Any]]:
     """Submit statement and return result rows (poll if async)."""
-    resp = requests.post(
-        ENDPOINT,
-        headers=_headers(),
-        json=_body(statement, bindings, timeout=60),
-    )
-    raw = resp.text
-    try:
-        data = json.loads(raw) if raw else {}
-    except json.JSONDecodeError:
-        data = {}
-    if not resp.ok:
-        raise RuntimeError(f"Snowflake error ({resp.status_code}): {raw}")
-
-    # Inline result
-    if data.get("data") is not None:
-        return data["data"]
-    handle = data.get("statementHandle")
-    if not handle:
-        return []
-
-    # Poll for result
-    for _ in range(60):
-        time.sleep(0.5)
-        r2 = requests.get(f"{ENDPOINT}/{handle}", headers=_headers())
-        r2.raise_for_status()
-        d = r2.json()
-        if d.get("status") == "SUCCESS" and "data" in d:
-            return d.get("data", [])
-        if d.get("status") in ("FAILED", "ABORTED"):
-            raise RuntimeError(d.get("message", str(d)))
-    return []
+    return _call(statement, bindings, timeout=60, fetch=True)
@@ -1,29 +1,55 @@
 """
 Tag document chunks with unit/topic/subtopic from the lesson plan (batched LLM calls).
 A chunk can have multiple assignments and will appear when queried by any of its tags.
-Run after build_lesson_plan.py. Re-running overwrites assignments for the course.
+Run after build_lesson_plan.py. Re-running skips chunks that already have
+assignments; pass --force to delete them and re-tag the whole course.
 Usage:
-  python tag_chunks.py --course-id 45110000000215700 --batch-size 10
+  python tag_chunks.py --course-id 45110000000215700 --batch-size 25
 """
 from __future__ import annotations
 
 import argparse
-import json
-import re
+import asyncio
+import random
 import sys
-from typing import Any
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from typing import Any, Iterable, Iterator
 
+import httpx
 from google import genai
+from google.genai import types
 
+import jsonfast
 from config import GEMINI_API_KEY, GEMINI_GENERATION_MODEL
 from snowflake_rag import (
     delete_chunk_assignments_for_course,
-    get_chunks_for_course,
     get_lesson_plan,
-    upsert_chunk_assignment,
+    get_tagged_chunk_ids,
+    iter_chunks_for_course,
+    upsert_chunk_assignments_bulk,
 )
 
-BATCH_SIZE_DEFAULT = 10
+# 25 chunks (truncated to 600 chars each) plus the plan summary stays well
+# under the model context while amortizing per-call overhead further
+BATCH_SIZE_DEFAULT = 25
+# Tagging calls in flight at once; batches are independent so they overlap
+# fully, bounded to stay inside Gemini rate limits
+MAX_CONCURRENCY_DEFAULT = 4
+# Failed calls are retried this many times with exponential backoff plus
+# jitter before the batch is reported as an error (transient 429/503s are
+# the norm at high concurrency)
+TAG_RETRIES = 2
+# Approximate input-token ceiling per prompt (~4 chars/token on course text).
+# Batches flush at whichever comes first: this budget or batch_size chunks,
+# so prompts stay well inside the model context even with long chunks
+TOKEN_BUDGET_DEFAULT = 24_000
+# Chunk text is truncated to this many chars in the prompt
+PROMPT_TEXT_CHARS = 600
+# Validated assignments per bulk MERGE statement (matches the chunk-insert
+# cap; keeps binding counts inside REST API limits)
+UPSERT_FLUSH_ROWS = 500
 _client: genai.Client | None = None
 
 
@@ -32,140 +58,425 @@ def _get_client() -> genai.Client:
     if _client is None:
         if not GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY required")
-        _client = genai.Client(api_key=GEMINI_API_KEY)
+        # One process-global client with explicit keep-alive pool limits, so
+        # concurrent tagging calls reuse warm connections instead of paying a
+        # TLS handshake per request once concurrency exceeds httpx defaults
+        limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        _client = genai.Client(
+            api_key=GEMINI_API_KEY,
+            http_options=types.HttpOptions(
+                client_args={"limits": limits},
+                async_client_args={"limits": limits},
+            ),
+        )
     return _client
 
 
-def _plan_summary(plan: dict[str, Any]) -> str:
-    """Build a compact list of valid unit/topic/subtopic IDs and names for the prompt."""
+def _plan_summary(plan: dict[str, Any], compact: bool = False) -> str:
+    """Build the list of valid unit/topic/subtopic IDs and names for the prompt.
+
+    Compact mode uses one-letter level markers and indentation instead of the
+    Unit:/Topic:/Subtopic: labels and the parent-id annotations (which repeat
+    ids the hierarchy already implies), roughly halving the summary's token
+    count on large plans. Names stay in both modes -- the model needs them to
+    match chunk text to the right node.
+    """
     lines = ["Valid IDs (use these exact strings in your response):"]
     for u in plan.get("units") or []:
         uid = u.get("unit_id") or ""
         uname = u.get("unit_name") or ""
-        lines.append(f"  Unit: {uid} = {uname}")
+        lines.append(f"U {uid} {uname}" if compact else f"  Unit: {uid} = {uname}")
         for t in u.get("topics") or []:
             tid = t.get("topic_id") or ""
             tname = t.get("topic_name") or ""
-            lines.append(f"    Topic: {tid} = {tname} (unit {uid})")
+            lines.append(f" T {tid} {tname}" if compact else f"    Topic: {tid} = {tname} (unit {uid})")
             for s in t.get("subtopics") or []:
-                sid = s.get("subtopic_id") if isinstance(s, dict) else ""
-                sname = s.get("subtopic_name", s) if isinstance(s, dict) else str(s)
                 if isinstance(s, dict):
-                    lines.append(f"      Subtopic: {sid} = {sname} (topic {tid})")
+                    sid = s.get("subtopic_id") or ""
+                    sname = s.get("subtopic_name") or ""
+                    lines.append(f"  S {sid} {sname}" if compact else f"      Subtopic: {sid} = {sname} (topic {tid})")
+    if compact:
+        lines.insert(1, "Levels: U = unit, T = topic, S = subtopic (nested by indentation).")
     return "\n".join(lines)
 
 
-def _build_tag_prompt(plan_summary: str, chunks_batch: list[dict[str, Any]]) -> str:
+# Fixed prompt fragments live at module scope (same layout as
+# generate_questions): per batch only the chunk block varies, so the plan
+# summary and instructions are concatenated once per course, not per prompt
+_TAG_PROMPT_HEAD = "You are assigning course chunks to a lesson plan hierarchy (unit, optional topic, optional subtopic).\n\n"
+
+_TAG_PROMPT_CHUNKS = "\n\nChunks to assign (each can have MULTIPLE assignments if it spans units/topics):\n"
+
+_TAG_PROMPT_FOOTER = """
+
+For each chunk_id, output one or more assignments. Use ONLY the unit_id, topic_id, subtopic_id values from the list above. Use empty string "" for topic_id or subtopic_id if the chunk is only assigned to a unit.
+Include every chunk_id at least once. A chunk can appear multiple times with different (unit_id, topic_id, subtopic_id)."""
+
+# Structured output: the model is constrained to this shape, so responses are
+# guaranteed parseable JSON and the prompt no longer has to spell out (and
+# spend tokens on) the output format
+_ASSIGNMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "assignments": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "chunk_id": {"type": "string"},
+                    "unit_id": {"type": "string"},
+                    "topic_id": {"type": "string"},
+                    "subtopic_id": {"type": "string"},
+                },
+                "required": ["chunk_id", "unit_id"],
+            },
+        }
+    },
+    "required": ["assignments"],
+}
+
+_GENERATION_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=_ASSIGNMENT_SCHEMA,
+)
+
+
+def _tag_prompt_prefix(plan_summary: str) -> str:
+    """Everything before the per-batch chunk block, built once per course."""
+    return f"{_TAG_PROMPT_HEAD}{plan_summary}{_TAG_PROMPT_CHUNKS}"
+
+
+def _build_tag_prompt(prefix: str, chunks_batch: list[dict[str, Any]]) -> str:
     chunk_blobs = []
     for c in chunks_batch:
         cid = c.get("chunk_id") or ""
-        text = (c.get("text") or "")[:600].strip()
+        text = (c.get("text") or "")[:PROMPT_TEXT_CHARS].strip()
         chunk_blobs.append(f"[chunk_id: {cid}]\n{text}")
-    chunks_block = "\n\n".join(chunk_blobs)
-    return f"""You are assigning course chunks to a lesson plan hierarchy (unit, optional topic, optional subtopic).
+    return "".join((prefix, "\n\n".join(chunk_blobs), _TAG_PROMPT_FOOTER))
 
-{plan_summary}
 
-Chunks to assign (each can have MULTIPLE assignments if it spans units/topics):
-{chunks_block}
+def _dedupe_chunks(
+    chunks: Iterable[dict[str, Any]], duplicates: dict[str, list[str]]
+) -> Iterator[dict[str, Any]]:
+    """
+    Yield only the first chunk seen for each distinct truncated text; later
+    chunks with the same text (boilerplate headers, repeated page furniture)
+    are recorded in duplicates keyed by the representative's chunk_id. The
+    prompt only sees the truncated text, so identical truncations would get
+    identical treatment from the model anyway -- sending one representative
+    saves the tokens, and its assignments fan out to the whole group.
+    """
+    seen: dict[bytes, str] = {}
+    for c in chunks:
+        cid = c.get("chunk_id") or ""
+        digest = blake2b(
+            (c.get("text") or "")[:PROMPT_TEXT_CHARS].encode("utf-8"), digest_size=8
+        ).digest()
+        rep = seen.get(digest)
+        if rep is None:
+            seen[digest] = cid
+            yield c
+        else:
+            duplicates.setdefault(rep, []).append(cid)
 
-For each chunk_id, output one or more assignments. Use ONLY the unit_id, topic_id, subtopic_id values from the list above. Use empty string "" for topic_id or subtopic_id if the chunk is only assigned to a unit.
-Return ONLY valid JSON (no markdown) in this format:
-{{"assignments": [{{"chunk_id": "...", "unit_id": "...", "topic_id": "...", "subtopic_id": "..."}}, ...]}}
-Include every chunk_id at least once. A chunk can appear multiple times with different (unit_id, topic_id, subtopic_id)."""
+
+def _pack_batches(
+    chunks: Iterable[dict[str, Any]], batch_size: int, token_budget: int
+) -> Iterator[list[dict[str, Any]]]:
+    """
+    Greedy-pack chunks into prompt batches: a batch flushes when it reaches
+    batch_size chunks or when its estimated token count would pass
+    token_budget. Short chunks therefore ride together up to the count cap,
+    while unusually long ones get smaller batches instead of oversized prompts.
+    Lazily consumes its input, so a paged chunk iterator never needs the whole
+    course in memory at once.
+    """
+    current: list[dict[str, Any]] = []
+    current_tokens = 0
+    for c in chunks:
+        tokens = len((c.get("text") or "")[:PROMPT_TEXT_CHARS]) // 4 + 16
+        if current and (len(current) >= batch_size or current_tokens + tokens > token_budget):
+            yield current
+            current = []
+            current_tokens = 0
+        current.append(c)
+        current_tokens += tokens
+    if current:
+        yield current
 
 
 def _parse_assignments(response_text: str) -> list[dict[str, Any]]:
     text = (response_text or "").strip()
-    m = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
-    if m:
-        text = m.group(1).strip()
+    # Most responses are already bare JSON; when a fence is present, a
+    # partition scan pulls out the first block without regex machinery
+    if "```" in text:
+        _, _, rest = text.partition("```")
+        if rest.startswith("json"):
+            rest = rest[4:]
+        body, _, _ = rest.partition("```")
+        text = body.strip()
     try:
-        data = json.loads(text)
+        data = jsonfast.loads(text)
         return data.get("assignments") if isinstance(data, dict) else []
-    except json.JSONDecodeError:
+    except ValueError:
         return []
 
 
-def tag_chunks_for_course(course_id: str, batch_size: int = BATCH_SIZE_DEFAULT) -> dict[str, Any]:
+async def _generate_tags(client: genai.Client, prompt: str) -> str:
+    """One tagging call, retried in place on transient errors.
+
+    Retrying inside the call (rather than requeueing failed batches for a
+    later round) keeps the worker pool saturated: a 429/503 costs only this
+    worker's backoff while the others keep streaming. Jitter spreads the
+    retries so a rate-limit burst does not resubmit in lockstep.
+    """
+    for attempt in range(TAG_RETRIES + 1):
+        try:
+            response = await client.aio.models.generate_content(
+                model=GEMINI_GENERATION_MODEL,
+                contents=prompt,
+                config=_GENERATION_CONFIG,
+            )
+            return response.text if hasattr(response, "text") else str(response)
+        except Exception:
+            if attempt == TAG_RETRIES:
+                raise
+            await asyncio.sleep(min(32.0, 2.0**attempt) + random.random())
+    raise RuntimeError("unreachable")
+
+
+async def _run_tagging(
+    client: genai.Client, prompts: list[str], max_concurrency: int
+) -> tuple[dict[int, str], list[tuple[int, str]]]:
+    """
+    Run tagging prompts through a pool of max_concurrency worker tasks fed
+    from a shared queue: a new request dispatches the moment one completes,
+    so exactly that many calls stay in flight until the queue drains, instead
+    of launching everything at once and finishing in waves. A batch that
+    exhausts its in-call retries is recorded as a failure, never aborting the
+    rest. Returns (texts by prompt index, failures).
+    """
+    texts_by_idx: dict[int, str] = {}
+    failed: list[tuple[int, str]] = []
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(len(prompts)):
+        queue.put_nowait(i)
+
+    async def worker() -> None:
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                texts_by_idx[i] = await _generate_tags(client, prompts[i])
+            except Exception as e:
+                failed.append((i, str(e)))
+
+    workers = min(max_concurrency, len(prompts)) or 1
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return texts_by_idx, failed
+
+
+# Gemini batch jobs: terminal states and how often to check for them
+_BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+_BATCH_POLL_SECONDS = 30
+
+
+def _generate_tags_batch_api(client: genai.Client, prompts: list[str]) -> list[str]:
+    """
+    Submit all tagging prompts as one Gemini batch job and poll until done.
+    Bulk tagging is latency-tolerant, and batch pricing is roughly half of
+    interactive calls with no rate-limit pressure. Returns one response text
+    per prompt, in order.
+    """
+    job = client.batches.create(
+        model=GEMINI_GENERATION_MODEL,
+        src=[
+            {
+                "contents": [{"role": "user", "parts": [{"text": p}]}],
+                "config": _GENERATION_CONFIG,
+            }
+            for p in prompts
+        ],
+    )
+    while job.state.name not in _BATCH_DONE_STATES:
+        time.sleep(_BATCH_POLL_SECONDS)
+        job = client.batches.get(name=job.name)
+    if job.state.name != "JOB_STATE_SUCCEEDED":
+        raise RuntimeError(f"Batch tagging job ended in state {job.state.name}")
+    texts: list[str] = []
+    for item in job.dest.inlined_responses or []:
+        resp = getattr(item, "response", None)
+        texts.append(resp.text if resp is not None and getattr(resp, "text", None) else "")
+    return texts
+
+
+def tag_chunks_for_course(
+    course_id: str,
+    batch_size: int = BATCH_SIZE_DEFAULT,
+    max_concurrency: int = MAX_CONCURRENCY_DEFAULT,
+    use_batch_api: bool = False,
+    token_budget: int = TOKEN_BUDGET_DEFAULT,
+    force: bool = False,
+    compact_plan: bool = False,
+) -> dict[str, Any]:
     """
     Load lesson plan and chunks, then in batches call Gemini to assign (unit, topic, subtopic).
-    Replaces all existing chunk_assignments for this course.
+    Up to max_concurrency batch calls run at once; with use_batch_api the
+    batches go through the Gemini batch endpoint instead (slower to return,
+    half the cost). By default chunks that already have assignments are
+    skipped, so a rerun after a partial failure only pays for what is
+    missing; force=True deletes and re-tags everything.
     """
     plan = get_lesson_plan(course_id)
     if not plan.get("units"):
         return {"tagged": 0, "batches": 0, "error": "No lesson plan for this course. Run build_lesson_plan.py first."}
 
-    delete_chunk_assignments_for_course(course_id)
-    chunks = get_chunks_for_course(course_id)
-    if not chunks:
-        return {"tagged": 0, "batches": 0, "message": "No chunks for this course. Run ingest_course.py first."}
+    # The delete (or tagged-id fetch) and client/TLS setup are independent of
+    # prompt building, so they run on background threads; the delete only has
+    # to be confirmed before the first write
+    pool = ThreadPoolExecutor(max_workers=2)
+    delete_future = pool.submit(delete_chunk_assignments_for_course, course_id) if force else None
+    tagged_future = None if force else pool.submit(get_tagged_chunk_ids, course_id)
+    client_future = pool.submit(_get_client)
+    pool.shutdown(wait=False)
 
-    plan_summary = _plan_summary(plan)
-    client = _get_client()
-    valid_units = {u["unit_id"] for u in plan["units"]}
-    valid_topics: set[str] = set()
-    valid_subtopics: set[str] = set()
+    plan_summary = _plan_summary(plan, compact=compact_plan)
+    # Valid IDs as hierarchy-aware tuple sets: one hash lookup per level
+    # checks both existence and parentage (a topic id under the wrong unit no
+    # longer passes), instead of three independent membership tests
+    valid_units: set[str] = set()
+    valid_pairs: set[tuple[str, str]] = set()
+    valid_triples: set[tuple[str, str, str]] = set()
     for u in plan["units"]:
+        uid = u["unit_id"]
+        valid_units.add(uid)
         for t in u.get("topics") or []:
-            valid_topics.add(t["topic_id"])
+            tid = t["topic_id"]
+            valid_pairs.add((uid, tid))
             for s in t.get("subtopics") or []:
                 if isinstance(s, dict):
-                    valid_subtopics.add(s.get("subtopic_id") or "")
+                    valid_triples.add((uid, tid, s.get("subtopic_id") or ""))
 
-    tagged_count = 0
-    batch_count = 0
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i : i + batch_size]
-        prompt = _build_tag_prompt(plan_summary, batch)
+    # Chunks stream page by page straight into batch packing; each batch is
+    # reduced to its prompt (600-char truncations) immediately, so peak memory
+    # is one DB page plus the prompts, never the course's full chunk texts
+    prompt_prefix = _tag_prompt_prefix(plan_summary)
+    already_tagged = tagged_future.result() if tagged_future else frozenset()
+    skipped = 0
+
+    def _untagged() -> Iterator[dict[str, Any]]:
+        nonlocal skipped
+        for c in iter_chunks_for_course(course_id):
+            if (c.get("chunk_id") or "") in already_tagged:
+                skipped += 1
+            else:
+                yield c
+
+    prompts: list[str] = []
+    chunks_total = 0
+    duplicates: dict[str, list[str]] = {}
+    deduped = _dedupe_chunks(_untagged(), duplicates)
+    for b in _pack_batches(deduped, batch_size, token_budget):
+        chunks_total += len(b)
+        prompts.append(_build_tag_prompt(prompt_prefix, b))
+    chunks_total += sum(len(v) for v in duplicates.values())
+    if not prompts:
+        if delete_future:
+            delete_future.result()
+        if skipped:
+            return {"tagged": 0, "batches": 0, "skipped": skipped, "message": "All chunks already tagged. Use --force to re-tag."}
+        return {"tagged": 0, "batches": 0, "message": "No chunks for this course. Run ingest_course.py first."}
+    client = client_future.result()
+    texts: list[str] = []
+    errors: list[str] = []
+    if use_batch_api:
         try:
-            response = client.models.generate_content(
-                model=GEMINI_GENERATION_MODEL,
-                contents=prompt,
-            )
-            text = response.text if hasattr(response, "text") else str(response)
+            texts = _generate_tags_batch_api(client, prompts)
         except Exception as e:
-            return {"tagged": tagged_count, "batches": batch_count, "error": str(e)}
-        assignments = _parse_assignments(text)
-        for a in assignments:
+            return {"tagged": 0, "batches": 0, "error": str(e)}
+    else:
+        # Fan the LLM calls out on an event loop (each is pure network wait).
+        # A failed batch does not abort the run: only batches that exhaust
+        # their in-call retries become errors.
+        texts_by_idx, failed = asyncio.run(_run_tagging(client, prompts, max_concurrency))
+        errors = [f"batch {i}: {msg}" for i, msg in failed]
+        texts = [texts_by_idx[i] for i in sorted(texts_by_idx)]
+
+    # With --force, writes must land after the old assignments are gone
+    if delete_future:
+        delete_future.result()
+
+    # Collect validated assignments and merge them in bulk: one statement per
+    # UPSERT_FLUSH_ROWS rows instead of one round-trip per assignment
+    batch_count = 0
+    rows: list[tuple[str, str, str, str]] = []
+    for text in texts:
+        for a in _parse_assignments(text):
             cid = a.get("chunk_id")
             uid = (a.get("unit_id") or "").strip()
-            tid = (a.get("topic_id") or "").strip()
-            sid = (a.get("subtopic_id") or "").strip()
             if not cid or uid not in valid_units:
                 continue
-            if tid and tid not in valid_topics:
+            tid = (a.get("topic_id") or "").strip()
+            sid = (a.get("subtopic_id") or "").strip()
+            if tid and (uid, tid) not in valid_pairs:
                 tid = ""
-            if sid and sid not in valid_subtopics:
+            if sid and (not tid or (uid, tid, sid) not in valid_triples):
                 sid = ""
-            try:
-                upsert_chunk_assignment(cid, uid, tid, sid)
-                tagged_count += 1
-            except Exception:
-                pass
+            rows.append((cid, uid, tid, sid))
+            # Fan the representative's assignment out to its duplicates
+            for dup_cid in duplicates.get(cid, ()):
+                rows.append((dup_cid, uid, tid, sid))
         batch_count += 1
 
-    return {"tagged": tagged_count, "batches": batch_count, "chunks_total": len(chunks)}
+    tagged_count = 0
+    for i in range(0, len(rows), UPSERT_FLUSH_ROWS):
+        flush = rows[i : i + UPSERT_FLUSH_ROWS]
+        try:
+            upsert_chunk_assignments_bulk(flush)
+            tagged_count += len(flush)
+        except Exception as e:
+            errors.append(f"assignment flush at row {i}: {e}")
+
+    result = {"tagged": tagged_count, "batches": batch_count, "chunks_total": chunks_total}
+    if skipped:
+        result["skipped"] = skipped
+    if errors:
+        result["errors"] = errors
+    return result
 
 
 def main() -> None:
     ap = argparse.ArgumentParser(description="Tag chunks with unit/topic/subtopic (batched)")
     ap.add_argument("--course-id", type=str, required=True, help="Course ID")
-    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE_DEFAULT, help="Chunks per LLM call")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE_DEFAULT, help="Max chunks per LLM call")
+    ap.add_argument("--token-budget", type=int, default=TOKEN_BUDGET_DEFAULT, help="Approx input tokens per LLM call before a batch flushes")
+    ap.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY_DEFAULT, help="Tagging calls in flight at once")
+    ap.add_argument("--use-batch-api", action="store_true", help="Submit tagging as a Gemini batch job (cheaper, slower)")
+    ap.add_argument("--force", action="store_true", help="Delete existing assignments and re-tag every chunk")
+    ap.add_argument("--compact-plan", action="store_true", help="Use the terse plan summary in prompts (fewer tokens per call)")
     ap.add_argument("--json", action="store_true", help="Output JSON")
     args = ap.parse_args()
     try:
-        result = tag_chunks_for_course(args.course_id, args.batch_size)
+        result = tag_chunks_for_course(
+            args.course_id, args.batch_size, args.max_concurrency, args.use_batch_api,
+            args.token_budget, args.force, args.compact_plan,
+        )
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
     if args.json:
-        print(json.dumps(result, indent=2))
+        print(jsonfast.dumps(result, indent=2))
     else:
         if result.get("error"):
             print(result["error"], file=sys.stderr)
             sys.exit(1)
-        print(f"Tagged {result.get('tagged', 0)} assignments in {result.get('batches', 0)} batches ({result.get('chunks_total', 0)} chunks).")
+        for msg in result.get("errors") or []:
+            print(f"Warning: {msg}", file=sys.stderr)
+        skipped = result.get("skipped", 0)
+        suffix = f", {skipped} already tagged" if skipped else ""
+        print(f"Tagged {result.get('tagged', 0)} assignments in {result.get('batches', 0)} batches ({result.get('chunks_total', 0)} chunks{suffix}).")
 
 
 if __name__ == "__main__":